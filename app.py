@@ -1,6 +1,7 @@
 import asyncio
 import os
 from aiogram import Bot, Dispatcher, types
+from aiogram.fsm.storage.memory import SimpleEventIsolation
 from aiogram.filters import CommandStart
 from aiogram.filters import Command
 from aiogram.enums import ParseMode
@@ -10,29 +11,73 @@ from dotenv import find_dotenv, load_dotenv
 
 
 load_dotenv(find_dotenv())
-from middlewares.db import DataBaseSession
-from database.engine import create_db, drop_db, session_maker
+from middlewares.db import CommitBeforeRequest, DataBaseSession
+from middlewares.metrics import Instrumentation, insert_before_fsm
+from middlewares.query_profiler import create_query_profiler
+from middlewares.throttling import SendRateLimiter
+from database.engine import create_db, drop_db, engine, session_maker
+from database.fsm_storage import create_fsm_storage
+from database.orm_query import orm_warm_user_caches
+from common.media import media_store
+from common.tasks import create_background_task
+from common.admins import admin_registry
 #from middlewares.db import CounterMiddleware
 
 from handlers.user_private import user_private_router
-from handlers.user_group import user_group_router
+from handlers.user_group import group_data_refresher, reload_chat_admins, safe_refresh_chat_admins, user_group_router
 from handlers.admin_private import admin_router 
+from handlers.inline_search import inline_router
 from common.bot_cmds_list import private
+from handlers.broadcast import resume_broadcasts
+from handlers.menu_processing import screens_cache
+from webhook import WEBHOOK_WORKERS, run_webhook
 
 ALLOWED_UPDATES = ['message, edited_message']
+# DB_UNIT_OF_WORK=1 - одна транзакция на апдейт вместо коммита в каждой orm-функции.
+# По умолчанию выключено.
+UNIT_OF_WORK = os.getenv('DB_UNIT_OF_WORK') == '1'
 bot = Bot(token=os.getenv('TOKEN'), parse_mode=ParseMode.HTML)
-bot.my_admins_list = []
-dp = Dispatcher()
+if UNIT_OF_WORK:
+    # Транзакция апдейта коммитится до запроса к Telegram (и до очереди лимитера)
+    bot.session.middleware(CommitBeforeRequest())
+# Все исходящие запросы проходят через общий планировщик с лимитами Telegram.
+# Лимитер свой в каждом процессе, поэтому webhook-воркеры делят общий лимит между собой
+# (апдейты одного чата всегда идут в один воркер, так что лимит чата не делится).
+SENDER_PROCESSES = WEBHOOK_WORKERS if os.getenv('BOT_MODE', 'polling') == 'webhook' else 1
+send_limiter = SendRateLimiter(
+    global_rate=float(os.getenv('SEND_GLOBAL_RATE', 25)) / max(SENDER_PROCESSES, 1),
+    chat_rate=float(os.getenv('SEND_CHAT_RATE', 1)),
+)
+bot.session.middleware(send_limiter)
+# Состояния FSM хранятся в БД (или Redis), а не в памяти процесса
+# SimpleEventIsolation обрабатывает апдейты одного чата по очереди
+dp = Dispatcher(
+    storage=create_fsm_storage(session_maker),
+    events_isolation=SimpleEventIsolation(),
+)
 
 #admin_router.message.middleware(CounterMiddleware)
 
 dp.include_router(user_private_router)
 dp.include_router(user_group_router)
 dp.include_router(admin_router)
+dp.include_router(inline_router)
+# Доступно в хендлерах как session_pool (например, для фоновой рассылки)
+dp['session_pool'] = session_maker
+# Метрики хендлеров и SQL-запросов: /stats в админке и Prometheus на METRICS_PORT
+metrics = Instrumentation(engine)
+metrics.add_collector('sender', send_limiter.stats)
+metrics.add_collector('screens_cache', screens_cache.stats)
+dp['metrics'] = metrics
+# Медленные запросы и повторы внутри апдейта (QUERY_PROFILE=debug|sample)
+profiler = create_query_profiler(engine)
 # Множество для хранения зарегистрированных пользователей
    
-async def on_startup(bot):
+# Ссылки на фоновые задачи, чтобы их не собрал сборщик мусора
+background_tasks = set()
 
+
+async def prepare_db():
     #run_param = False
     #if run_param:
     #await drop_db()
@@ -40,18 +85,92 @@ async def on_startup(bot):
     await create_db()
 
 
+async def on_startup(bot, create_schema: bool = True, primary: bool = True, worker: int = 0):
+    # В webhook-режиме с несколькими воркерами схему один раз готовит главный процесс
+    if create_schema:
+        await prepare_db()
+
+    # Зарегистрированные пользователи переживают перезапуск бота
+    async with session_maker() as session:
+        count = await orm_warm_user_caches(session)
+    print(f'Загружено пользователей: {count}')
+
+    # file_id уже загруженных локальных картинок
+    count = await media_store.setup(session_maker)
+    print(f'Загружено file_id картинок: {count}')
+
+    # Админы групп известны сразу, без повторного /admin в каждой группе
+    count = await reload_chat_admins(session_maker)
+    print(f'Загружено групп с админами: {count}')
+    if not admin_registry.owner_ids and not admin_registry.admin_chat_ids:
+        # После обновления /admin в группе сам по себе доступа больше не дает
+        print(
+            'ВНИМАНИЕ: OWNER_IDS и ADMIN_CHAT_IDS не заданы - админка недоступна никому. '
+            'Укажите в .env id владельцев или групп, админы которых управляют магазином '
+            '(см. Инструкция.txt, шаг 6).'
+        )
+    # Группы, дающие доступ к админке, сверяем с Telegram сразу
+    for chat_id in admin_registry.admin_chat_ids:
+        await safe_refresh_chat_admins(bot, session_maker, chat_id)
+
+    # Запрещенные слова и админы групп перечитываются из БД периодически
+    background_tasks.add(create_background_task(group_data_refresher(
+        session_maker, interval=float(os.getenv('GROUP_RELOAD_INTERVAL', 60)),
+    )))
+
+    # У каждого воркера webhook-режима свой порт метрик: METRICS_PORT + номер
+    if os.getenv('METRICS_PORT'):
+        port = int(os.getenv('METRICS_PORT')) + worker
+        await metrics.serve(os.getenv('METRICS_HOST', '127.0.0.1'), port)
+        print(f'Метрики: http://127.0.0.1:{port}/metrics')
+
+    # Прерванные рассылки продолжает только один процесс
+    if primary:
+        count = await resume_broadcasts(bot, session_maker)
+        if count:
+            print(f'Продолжено рассылок: {count}')
+
+
 async def on_shutdown(bot):
+    if profiler is not None:
+        profiler.report()
     print('бот лег')
 
-async def main():
+
+def setup_dispatcher():
     dp.startup.register(on_startup)
     dp.shutdown.register(on_shutdown)
 
-    dp.update.middleware(DataBaseSession(session_pool=session_maker))
+    db_session = DataBaseSession(session_pool=session_maker, transactional=UNIT_OF_WORK)
+    dp.update.middleware(db_session)
+    metrics.add_collector('db_session', lambda: {
+        'updates': db_session.updates,
+        'updates_with_db': db_session.updates_with_db,
+    })
+    metrics.setup(dp)
+    if profiler is not None:
+        insert_before_fsm(dp, profiler)
+
+
+async def main():
+    setup_dispatcher()
 
     await bot.delete_webhook(drop_pending_updates=True)
     #await bot.delete_my_commands(scope=types.BotCommandScopeAllPrivateChats())
     #await bot.set_my_commands(commands=private, scope=types.BotCommandScopeAllPrivateChats())
     await dp.start_polling(bot, allowed_updates= dp.resolve_used_update_types())
 
-asyncio.run(main())
\ No newline at end of file
+
+async def prepare_db_for_workers():
+    await prepare_db()
+    # Соединения не должны достаться воркерам через fork
+    await engine.dispose()
+
+
+if __name__ == '__main__':
+    # BOT_MODE=polling (по умолчанию) или webhook, настройки webhook - в webhook.py
+    if os.getenv('BOT_MODE', 'polling') == 'webhook':
+        setup_dispatcher()
+        run_webhook(dp, bot, prepare=prepare_db_for_workers)
+    else:
+        asyncio.run(main())
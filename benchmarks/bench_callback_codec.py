@@ -0,0 +1,63 @@
+# Пропускная способность упаковки и разбора callback_data меню:
+# стандартный текстовый формат aiogram против kbds/callback_codec.py.
+# Запуск из корня проекта: python -m benchmarks.bench_callback_codec
+import time
+
+from aiogram.filters.callback_data import CallbackData
+
+from kbds.inline import MenuCallBack
+
+
+ROUNDS = 50000
+
+
+class OldMenuCallBack(CallbackData, prefix="menu"):
+    # Прежнее определение MenuCallBack без своего кодека
+    level: int
+    menu_name: str
+    category: int | None = None
+    page: int = 1
+    product_id: int | None = None
+
+
+SAMPLES = [
+    dict(level=0, menu_name="main"),
+    # Имя подлиннее в старом формате уже не помещается в 64 байта
+    dict(level=2, menu_name="Легковые премиум", category=12),
+    dict(level=2, menu_name="next", category=12, page=37),
+    dict(level=3, menu_name="increment", page=5, product_id=48213),
+]
+
+
+def measure(name: str, callback_class):
+    callbacks = [callback_class(**sample) for sample in SAMPLES]
+    packed = [callback.pack() for callback in callbacks]
+
+    started = time.perf_counter()
+    for _ in range(ROUNDS):
+        for callback in callbacks:
+            callback.pack()
+    pack_time = time.perf_counter() - started
+
+    started = time.perf_counter()
+    for _ in range(ROUNDS):
+        for value in packed:
+            callback_class.unpack(value)
+    unpack_time = time.perf_counter() - started
+
+    total = ROUNDS * len(SAMPLES)
+    size = sum(len(value.encode()) for value in packed) / len(packed)
+    print(
+        f"{name:<8} pack: {total / pack_time:9.0f}/с, unpack: {total / unpack_time:9.0f}/с, "
+        f"средний размер: {size:.1f} байт"
+    )
+
+
+def main():
+    print(f"Операций: {ROUNDS * len(SAMPLES)}")
+    measure("aiogram", OldMenuCallBack)
+    measure("кодек", MenuCallBack)
+
+
+if __name__ == "__main__":
+    main()
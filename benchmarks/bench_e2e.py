@@ -0,0 +1,251 @@
+# Сквозной бенчмарк: настоящий Dispatcher из app.py против локального
+# поддельного Bot API (aiohttp). Сценарии пользователей: регистрация,
+# листание каталога, добавление в корзину, +1/-1 час и удаление.
+# Печатает апдейты/с, задержки p50/p95/p99 и SQL-запросы на апдейт.
+#
+# Запуск из корня проекта: python -m benchmarks.bench_e2e [пользователей] [страниц]
+# По умолчанию временная SQLite. Для PostgreSQL задайте BENCH_DB_URL
+# (отдельная пустая БД: таблицы будут удалены и созданы заново).
+# Поддельный API работает в том же процессе и делит с ботом процессор, поэтому
+# цифры полезны для сравнения версий между собой, а не как предел для продакшена.
+import asyncio
+import itertools
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+from aiohttp import web
+
+
+HOST = "127.0.0.1"
+PORT = int(os.getenv("BENCH_API_PORT", 8081))
+TOKEN = "123456:BENCHMARK"
+PRODUCTS = 50
+
+# Настройки бота до импорта app.py: своя БД, без лимитов Telegram на отправку
+os.environ["DB_URL"] = os.getenv(
+    "BENCH_DB_URL", f"sqlite+aiosqlite:///{tempfile.mkdtemp()}/bench_e2e.db"
+)
+os.environ["TOKEN"] = TOKEN
+os.environ["SEND_GLOBAL_RATE"] = "1000000"
+os.environ["SEND_CHAT_RATE"] = "1000000"
+os.environ.pop("METRICS_PORT", None)
+
+
+class FakeBotAPI:
+    # Поддельный Bot API: отдает апдейты через getUpdates и отвечает на вызовы бота.
+    # Пользователь ждет конкретный ответ бота (например, answerCallbackQuery
+    # в своем чате) - время от постановки апдейта до этого ответа и есть задержка.
+    def __init__(self):
+        self.updates: list[dict] = []
+        self.new_updates = asyncio.Event()
+        self.update_ids = itertools.count(1)
+        self.message_ids = itertools.count(1)
+        # (chat_id, метод) -> future, который ждет пользователь
+        self.waiters: dict[tuple[int, str], asyncio.Future] = {}
+        self.calls: dict[str, int] = {}
+
+    def push(self, update: dict, chat_id: int, expect: str) -> asyncio.Future:
+        update["update_id"] = next(self.update_ids)
+        future = asyncio.get_running_loop().create_future()
+        self.waiters[(chat_id, expect)] = future
+        self.updates.append(update)
+        self.new_updates.set()
+        return future
+
+    def message(self, chat_id: int, message_id: int | None = None, photo: bool = False) -> dict:
+        message = {
+            "message_id": message_id or next(self.message_ids),
+            "date": int(time.time()),
+            "chat": {"id": chat_id, "type": "private"},
+        }
+        if photo:
+            message["photo"] = [{"file_id": "bench", "file_unique_id": "bench", "width": 1, "height": 1}]
+        return message
+
+    async def get_updates(self, params) -> list:
+        offset = int(params.get("offset", 0))
+        self.updates = [update for update in self.updates if update["update_id"] >= offset]
+        if not self.updates:
+            self.new_updates.clear()
+            try:
+                await asyncio.wait_for(self.new_updates.wait(), float(params.get("timeout", 10)))
+            except asyncio.TimeoutError:
+                return []
+        return self.updates[:100]
+
+    async def handle(self, request: web.Request) -> web.Response:
+        method = request.match_info["method"]
+        params = await request.post()
+        self.calls[method] = self.calls.get(method, 0) + 1
+
+        if method == "getUpdates":
+            result = await self.get_updates(params)
+        elif method == "getMe":
+            result = {"id": 123456, "is_bot": True, "first_name": "Bench", "username": "bench_bot"}
+        elif method in ("sendMessage", "sendPhoto"):
+            result = self.message(int(params["chat_id"]), photo=method == "sendPhoto")
+        elif method == "editMessageMedia":
+            result = self.message(int(params["chat_id"]), int(params["message_id"]), photo=True)
+        else:
+            result = True
+
+        if method == "answerCallbackQuery":
+            chat_id = int(params["callback_query_id"].split(":")[0])
+        else:
+            chat_id = int(params.get("chat_id", 0) or 0)
+        future = self.waiters.pop((chat_id, method), None)
+        if future is not None and not future.done():
+            future.set_result(result)
+        return web.json_response({"ok": True, "result": result})
+
+
+class User:
+    def __init__(self, api: FakeBotAPI, user_id: int):
+        self.api = api
+        self.user = {"id": user_id, "is_bot": False, "first_name": "Bench"}
+        self.menu_message_id = None
+        self.callbacks = itertools.count(1)
+        self.latencies: list[float] = []
+
+    async def step(self, update: dict, expect: str):
+        started = time.perf_counter()
+        result = await asyncio.wait_for(self.api.push(update, self.user["id"], expect), 30)
+        self.latencies.append(time.perf_counter() - started)
+        return result
+
+    async def send(self, expect: str = "sendMessage", **content):
+        message = {
+            "message_id": next(self.api.message_ids),
+            "date": int(time.time()),
+            "chat": {"id": self.user["id"], "type": "private"},
+            "from": self.user,
+            **content,
+        }
+        return await self.step({"message": message}, expect)
+
+    async def press(self, data: str):
+        callback = {
+            "id": f"{self.user['id']}:{next(self.callbacks)}",
+            "from": self.user,
+            "chat_instance": "bench",
+            "data": data,
+            "message": self.api.message(self.user["id"], self.menu_message_id, photo=True),
+        }
+        return await self.step({"callback_query": callback}, "answerCallbackQuery")
+
+    async def run(self, pages: int, product_ids: list[int]):
+        from kbds.inline import menu_callback
+
+        # Регистрация
+        await self.send(text="/start", entities=[{"type": "bot_command", "offset": 0, "length": 6}])
+        await self.send(text="Иван")
+        await self.send(text="Петров")
+        menu = await self.send(
+            expect="sendPhoto",
+            contact={"phone_number": "+70000000000", "first_name": "Иван", "user_id": self.user["id"]},
+        )
+        self.menu_message_id = menu["message_id"]
+
+        # Каталог и листание товаров
+        await self.press(menu_callback(1, "catalog"))
+        await self.press(menu_callback(2, "Дорогие", category=1))
+        for page in range(2, pages + 1):
+            await self.press(menu_callback(2, "next", category=1, page=page))
+
+        # Корзина
+        product_id = product_ids[(self.user["id"] + pages) % len(product_ids)]
+        await self.press(menu_callback(2, "add_to_cart", product_id=product_id))
+        await self.press(menu_callback(3, "cart"))
+        await self.press(menu_callback(3, "increment", page=1, product_id=product_id))
+        await self.press(menu_callback(3, "decrement", page=1, product_id=product_id))
+        await self.press(menu_callback(3, "delete", page=1, product_id=product_id))
+
+
+async def seed_catalog() -> list[int]:
+    from sqlalchemy import insert, select
+
+    from database.engine import drop_db, session_maker
+    from database.models import Product
+
+    await drop_db()
+    import app
+    await app.prepare_db()
+    async with session_maker() as session:
+        await session.execute(insert(Product), [
+            {
+                "name": f"Авто {number}",
+                "description": "Тестовое описание",
+                "price": 1000 + number,
+                "image": f"file_id_{number}",
+                "status": "свободен",
+                "category_id": 1,
+            }
+            for number in range(1, PRODUCTS + 1)
+        ])
+        await session.commit()
+        result = await session.execute(select(Product.id).where(Product.category_id == 1))
+        return list(result.scalars())
+
+
+def percentile(values: list[float], q: float) -> float:
+    return values[min(len(values) - 1, int(len(values) * q))]
+
+
+async def main(users: int, pages: int):
+    from aiogram.client.telegram import TelegramAPIServer
+
+    api = FakeBotAPI()
+    server = web.Application()
+    server.router.add_post("/bot{token}/{method}", api.handle)
+    runner = web.AppRunner(server, access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, HOST, PORT).start()
+
+    product_ids = await seed_catalog()
+
+    import app
+    app.bot.session.api = TelegramAPIServer.from_base(f"http://{HOST}:{PORT}")
+    app.setup_dispatcher()
+    polling = asyncio.create_task(app.dp.start_polling(
+        app.bot, handle_signals=False, close_bot_session=False,
+        allowed_updates=app.dp.resolve_used_update_types(),
+    ))
+    # Ждем, пока отработает on_startup и начнется опрос
+    while not api.calls.get("getUpdates"):
+        await asyncio.sleep(0.05)
+
+    sessions = [User(api, 100000 + index) for index in range(users)]
+    started = time.perf_counter()
+    await asyncio.gather(*(user.run(pages, product_ids) for user in sessions))
+    elapsed = time.perf_counter() - started
+
+    await app.dp.stop_polling()
+    await polling
+    await app.bot.session.close()
+    await runner.cleanup()
+
+    latencies = sorted(latency * 1000 for user in sessions for latency in user.latencies)
+    handled = sum(metrics.updates for metrics in app.metrics.handlers.values())
+    statements = sum(metrics.statements for metrics in app.metrics.handlers.values())
+    print(f"БД: {app.engine.dialect.name}, пользователей: {users}, страниц каталога: {pages}")
+    print(f"Апдейтов: {len(latencies)} за {elapsed:.2f} с - {len(latencies) / elapsed:.0f} апд./с")
+    print(
+        f"Задержка: p50 {statistics.median(latencies):.1f} мс, p95 {percentile(latencies, 0.95):.1f} мс,"
+        f" p99 {percentile(latencies, 0.99):.1f} мс"
+    )
+    print(f"SQL на апдейт: {statements / max(handled, 1):.2f}")
+    for (router, handler), metrics in sorted(app.metrics.handlers.items()):
+        print(
+            f"  {router}.{handler}: {metrics.updates} апд., SQL {metrics.statements / max(metrics.updates, 1):.2f},"
+            f" ср. {metrics.latency_sum / max(metrics.updates, 1) * 1000:.1f} мс"
+        )
+
+
+if __name__ == "__main__":
+    asyncio.run(main(
+        int(sys.argv[1]) if len(sys.argv) > 1 else 50,
+        int(sys.argv[2]) if len(sys.argv) > 2 else 10,
+    ))
@@ -0,0 +1,79 @@
+# Время и память на одну отрисовку клавиатуры меню: сборка с нуля против кэша.
+# Запуск из корня проекта: python -m benchmarks.bench_keyboards
+import time
+import tracemalloc
+
+from aiogram.types import InlineKeyboardButton
+from aiogram.utils.keyboard import InlineKeyboardBuilder
+
+from kbds.inline import MenuCallBack, get_products_btns, get_user_cart
+
+
+RENDERS = 20000
+PRODUCTS = 50
+PAGINATION = {"◀ Пред.": "previous", "След. ▶": "next"}
+
+
+def build_products_btns(level, category, page, pagination_btns, product_id, sizes=(2, 1)):
+    # Прежний способ: новый builder и pack() для каждой кнопки при каждом вызове
+    keyboard = InlineKeyboardBuilder()
+    keyboard.add(InlineKeyboardButton(text='Назад',
+                callback_data=MenuCallBack(level=level-1, menu_name='catalog').pack()))
+    keyboard.add(InlineKeyboardButton(text='Корзина 🛒',
+                callback_data=MenuCallBack(level=3, menu_name='cart').pack()))
+    keyboard.add(InlineKeyboardButton(text='Арендовать 💵',
+                callback_data=MenuCallBack(level=level, menu_name='add_to_cart', product_id=product_id).pack()))
+    keyboard.adjust(*sizes)
+    row = []
+    for text, menu_name in pagination_btns.items():
+        page_number = page + 1 if menu_name == "next" else page - 1
+        row.append(InlineKeyboardButton(text=text,
+                callback_data=MenuCallBack(level=level, menu_name=menu_name,
+                                           category=category, page=page_number).pack()))
+    return keyboard.row(*row).as_markup()
+
+
+def render_old(i: int):
+    page = i % PRODUCTS + 1
+    return build_products_btns(2, 1, page, PAGINATION, page)
+
+
+def render_new(i: int):
+    page = i % PRODUCTS + 1
+    return get_products_btns(level=2, category=1, page=page, pagination_btns=PAGINATION, product_id=page)
+
+
+def render_cart(i: int):
+    page = i % PRODUCTS + 1
+    return get_user_cart(level=3, page=page, pagination_btns=PAGINATION, product_id=page)
+
+
+def measure(name: str, render):
+    render(0)
+    started = time.perf_counter()
+    for i in range(RENDERS):
+        render(i)
+    elapsed = time.perf_counter() - started
+
+    # Сколько памяти выделяется во время одной отрисовки (в среднем по 1000)
+    tracemalloc.start()
+    allocated = 0
+    for i in range(1000):
+        current, _ = tracemalloc.get_traced_memory()
+        tracemalloc.reset_peak()
+        render(i)
+        allocated += tracemalloc.get_traced_memory()[1] - current
+    tracemalloc.stop()
+
+    print(f"{name:<20} {elapsed / RENDERS * 1e6:8.2f} мкс, {allocated / 1000 / 1024:6.2f} КБ на отрисовку")
+
+
+def main():
+    print(f"Отрисовок: {RENDERS}, разных товаров: {PRODUCTS}")
+    measure("товар, без кэша", render_old)
+    measure("товар, с кэшем", render_new)
+    measure("корзина, с кэшем", render_cart)
+
+
+if __name__ == "__main__":
+    main()
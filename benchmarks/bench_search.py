@@ -0,0 +1,107 @@
+# Задержка поиска товаров (inline-режим) на синтетическом каталоге.
+# Запуск из корня проекта: python -m benchmarks.bench_search [число товаров]
+# По умолчанию временная SQLite; для PostgreSQL задайте BENCH_DB_URL.
+# Цель: p95 одной страницы результатов не больше SEARCH_TARGET_P95_MS (150 мс) на 100k товаров -
+# ответ на inline-запрос должен успевать за набором текста. При превышении код выхода 1.
+import asyncio
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+# database.engine при импорте создает движок по DB_URL - для бенчмарка он не нужен
+os.environ.setdefault("DB_URL", "sqlite+aiosqlite:///:memory:")
+
+from sqlalchemy import insert
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+from database.engine import drop_db, make_engine
+from database.migrations import run_migrations
+from database.models import Base, Category, Product
+from database.orm_query import orm_search_products
+
+
+BRANDS = ["Toyota", "BMW", "Audi", "Kia", "Hyundai", "Lada", "Skoda", "Mazda", "Nissan", "Volvo"]
+MODELS = ["Camry", "X5", "A6", "Rio", "Solaris", "Vesta", "Octavia", "CX-5", "Qashqai", "XC90"]
+WORDS = [
+    "седан", "кроссовер", "хэтчбек", "автомат", "механика", "полный", "привод", "дизель",
+    "бензин", "гибрид", "кожаный", "салон", "климат", "контроль", "камера", "парктроник",
+    "люк", "подогрев", "сидений", "навигация", "семейный", "экономичный", "просторный",
+]
+QUERIES = ["toyota", "bmw x5", "кросс", "дизель полный", "седан автомат кожаный", "volvo xc90 гибрид", "lad"]
+PAGES = 3
+PAGE_SIZE = 21
+TARGET_P95_MS = float(os.getenv("SEARCH_TARGET_P95_MS", 150))
+
+
+def make_products(rnd: random.Random, count: int) -> list[dict]:
+    return [
+        {
+            "name": f"{rnd.choice(BRANDS)} {rnd.choice(MODELS)} {rnd.randint(2005, 2024)}",
+            "description": " ".join(rnd.choices(WORDS, k=rnd.randint(6, 20))),
+            "price": rnd.randint(500, 9000),
+            "image": "file_id",
+            "status": "занят" if rnd.random() < 0.1 else "свободен",
+            "category_id": rnd.randint(1, 2),
+        }
+        for _ in range(count)
+    ]
+
+
+async def main(count: int) -> bool:
+    url = os.getenv("BENCH_DB_URL")
+    if url is None:
+        url = f"sqlite+aiosqlite:///{tempfile.mkdtemp()}/bench_search.db"
+    engine, _ = make_engine(url, "production")
+    session_maker = async_sessionmaker(bind=engine, class_=AsyncSession, expire_on_commit=False)
+
+    # drop_db удаляет и schema_version с индексом поиска - иначе повторный запуск
+    # на той же БД пропустил бы миграцию 3
+    await drop_db(engine)
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    await run_migrations(engine)
+
+    rnd = random.Random(1)
+    started = time.perf_counter()
+    async with session_maker() as session:
+        await session.execute(insert(Category), [{"name": "Дорогие"}, {"name": "Простые"}])
+        products = make_products(rnd, count)
+        for start in range(0, count, 10000):
+            await session.execute(insert(Product), products[start:start + 10000])
+        await session.commit()
+    print(f"Товаров: {count}, вставка с индексацией: {time.perf_counter() - started:.1f} с")
+
+    slow = []
+    async with session_maker() as session:
+        for text_query in QUERIES:
+            timings = []
+            found = 0
+            for _ in range(20):
+                for page in range(PAGES):
+                    started = time.perf_counter()
+                    result = await orm_search_products(session, text_query, offset=page * 20, limit=PAGE_SIZE)
+                    timings.append((time.perf_counter() - started) * 1000)
+                    found = max(found, len(result))
+            timings.sort()
+            p95 = timings[int(len(timings) * 0.95)]
+            if p95 > TARGET_P95_MS:
+                slow.append(text_query)
+            print(
+                f"{text_query!r:<28} p50: {statistics.median(timings):6.2f} мс, "
+                f"p95: {p95:6.2f} мс, на странице: {found}"
+            )
+
+    await engine.dispose()
+    if slow:
+        print(f"Цель p95 <= {TARGET_P95_MS:.0f} мс не достигнута: {', '.join(map(repr, slow))}")
+    else:
+        print(f"Цель p95 <= {TARGET_P95_MS:.0f} мс достигнута для всех запросов")
+    return not slow
+
+
+if __name__ == "__main__":
+    ok = asyncio.run(main(int(sys.argv[1]) if len(sys.argv) > 1 else 100_000))
+    sys.exit(0 if ok else 1)
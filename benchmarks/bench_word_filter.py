@@ -0,0 +1,71 @@
+# Стоимость проверки одного сообщения фильтром запрещенных слов.
+# Запуск из корня проекта: python -m benchmarks.bench_word_filter
+import random
+import string
+import time
+
+from common.word_filter import WordMatcher
+
+
+WORDS = 5000
+MESSAGES = 20000
+
+# Короткий корпус на точность: что фильтр должен поймать и что должен пропустить
+CHECK_WORDS = ["das", "спам", "хуй", "казино*", "купи сейчас"]
+MUST_MATCH = [
+    "DAS!", "это С.П.А.М", "с-п-а-м", "сп@м", "cпам", "спааам", "с.п.аа.м",
+    "лучшее КАЗИНО", "казиношка рядом", "купи   СЕЙЧАС",
+]
+MUST_PASS = [
+    "I had a snack", "Adidas", "we need as much", "ус памяти", "спамер",
+    "Застрахуй машину", "ХУ Йорк", "купи сейчасже", "т.е. сп ам",
+]
+
+
+def random_word(rnd: random.Random, length: int) -> str:
+    return "".join(rnd.choice("абвгдежзиклмнопрстуфхцчшщыэюя") for _ in range(length))
+
+
+def make_messages(rnd: random.Random, words: list[str]) -> list[str]:
+    messages = []
+    for _ in range(MESSAGES):
+        parts = [random_word(rnd, rnd.randint(2, 9)) for _ in range(rnd.randint(3, 30))]
+        if rnd.random() < 0.1:
+            # Каждое десятое - с замаскированным запрещенным словом
+            word = rnd.choice(words)
+            parts.insert(rnd.randrange(len(parts) + 1), ".".join(word).upper())
+        messages.append(" ".join(parts) + rnd.choice(string.punctuation))
+    return messages
+
+
+def check_accuracy() -> int:
+    matcher = WordMatcher(CHECK_WORDS)
+    errors = [text for text in MUST_MATCH if not matcher.find(text)]
+    errors += [f"{text} ({matcher.find(text)})" for text in MUST_PASS if matcher.find(text)]
+    for text in errors:
+        print(f"Ошибка фильтра: {text}")
+    print(f"Проверка точности: {len(MUST_MATCH) + len(MUST_PASS)} сообщений, ошибок: {len(errors)}")
+    return len(errors)
+
+
+def main():
+    check_accuracy()
+    rnd = random.Random(1)
+    words = [random_word(rnd, rnd.randint(6, 12)) for _ in range(WORDS)]
+    messages = make_messages(rnd, words)
+
+    started = time.perf_counter()
+    matcher = WordMatcher(words)
+    build = time.perf_counter() - started
+
+    started = time.perf_counter()
+    found = sum(1 for text in messages if matcher.find(text))
+    elapsed = time.perf_counter() - started
+
+    print(f"Слов: {matcher.size}, сборка автомата: {build * 1000:.1f} мс")
+    print(f"Сообщений: {len(messages)}, с совпадением: {found}")
+    print(f"На сообщение: {elapsed / len(messages) * 1e6:.1f} мкс ({len(messages) / elapsed:.0f} сообщ./с)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+import os
+import time
+
+
+def parse_ids(value: str | None) -> frozenset[int]:
+    # "123, 456" -> {123, 456}
+    return frozenset(int(item) for item in (value or "").replace(",", " ").split())
+
+
+class AdminRegistry:
+    # Админы групп по чатам: chat_id -> множество user_id.
+    # Список чата обновляется лениво, если старше ttl секунд, а между обновлениями
+    # поддерживается апдейтами chat_member. Бота можно добавить в любую группу,
+    # поэтому права в админке дает не любая группа, а только owner_ids
+    # и админы групп из admin_chat_ids.
+    def __init__(self, ttl: float = 3600, owner_ids=(), admin_chat_ids=()):
+        self.ttl = ttl
+        self.owner_ids = frozenset(owner_ids)
+        self.admin_chat_ids = frozenset(admin_chat_ids)
+        self.chats: dict[int, set[int]] = {}
+        # chat_id -> когда список чата последний раз запрашивался у Telegram
+        self.refreshed: dict[int, float] = {}
+
+    def is_admin(self, user_id: int, chat_id: int) -> bool:
+        return user_id in self.chats.get(chat_id, ())
+
+    def is_shop_admin(self, user_id: int) -> bool:
+        # Доступ к админке бота
+        if user_id in self.owner_ids:
+            return True
+        return any(self.is_admin(user_id, chat_id) for chat_id in self.admin_chat_ids)
+
+    def is_stale(self, chat_id: int) -> bool:
+        refreshed = self.refreshed.get(chat_id)
+        return refreshed is None or time.monotonic() - refreshed > self.ttl
+
+    def mark_refreshed(self, chat_id: int):
+        self.refreshed[chat_id] = time.monotonic()
+
+    def set_chat(self, chat_id: int, user_ids):
+        self.drop_chat(chat_id)
+        for user_id in user_ids:
+            self.add(chat_id, user_id)
+        self.mark_refreshed(chat_id)
+
+    def add(self, chat_id: int, user_id: int):
+        self.chats.setdefault(chat_id, set()).add(user_id)
+
+    def remove(self, chat_id: int, user_id: int):
+        self.chats.get(chat_id, set()).discard(user_id)
+
+    def drop_chat(self, chat_id: int):
+        self.chats.pop(chat_id, None)
+        self.refreshed.pop(chat_id, None)
+
+    def load(self, rows):
+        # Полная замена данными из БД (пары chat_id, user_id).
+        # Время обновления чатов сохраняется - загрузка не заменяет запрос к Telegram.
+        chats: dict[int, set[int]] = {}
+        for chat_id, user_id in rows:
+            chats.setdefault(chat_id, set()).add(user_id)
+        self.chats = chats
+        return len(chats)
+
+
+# ADMINS_TTL - через сколько секунд список админов группы запрашивается заново
+# OWNER_IDS - user_id владельцев магазина через запятую, админка доступна им всегда
+# ADMIN_CHAT_IDS - id групп через запятую, админы которых получают доступ к админке
+admin_registry = AdminRegistry(
+    ttl=float(os.getenv("ADMINS_TTL", 3600)),
+    owner_ids=parse_ids(os.getenv("OWNER_IDS")),
+    admin_chat_ids=parse_ids(os.getenv("ADMIN_CHAT_IDS")),
+)
@@ -0,0 +1,200 @@
+import asyncio
+import hashlib
+import os
+import sys
+
+from aiogram import Bot
+from aiogram.types import BufferedInputFile, InputMediaPhoto, Message
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+from database.orm_query import _after_commit, orm_add_media_file, orm_get_media_files
+
+
+# Картинки товаров и баннеров могут хранить не только file_id Telegram,
+# но и путь к локальному файлу (например, media/cars/bmw.jpg).
+# MEDIA_DIR - каталог с картинками, MEDIA_THUMB_SIZE - наибольшая сторона
+# уменьшенной копии, которая уходит в Telegram (нужен пакет Pillow).
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+MEDIA_DIR = os.getenv("MEDIA_DIR", os.path.join(BASE_DIR, "media"))
+THUMBS_DIR = os.path.join(MEDIA_DIR, ".thumbs")
+PLACEHOLDER = os.path.join(MEDIA_DIR, "placeholder.png")
+THUMB_SIZE = int(os.getenv("MEDIA_THUMB_SIZE", 1280))
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".webp")
+# Сколько секунд ждать чужую загрузку того же файла, прежде чем загрузить самим
+UPLOAD_WAIT = float(os.getenv("MEDIA_UPLOAD_WAIT", 10))
+
+
+def is_local(image: str) -> bool:
+    # У file_id Telegram нет расширения файла
+    return image.lower().endswith(IMAGE_EXTENSIONS)
+
+
+def file_hash(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as file:
+        for chunk in iter(lambda: file.read(1 << 16), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def make_thumbnail(path: str, content_hash: str) -> str:
+    # Уменьшенная копия хранится рядом с картинками и строится один раз.
+    # Без Pillow загружается исходный файл.
+    target = os.path.join(THUMBS_DIR, f"{content_hash}.jpg")
+    if os.path.exists(target):
+        return target
+    try:
+        from PIL import Image, ImageOps
+    except ImportError:
+        return path
+
+    os.makedirs(THUMBS_DIR, exist_ok=True)
+    with Image.open(path) as image:
+        image = ImageOps.exif_transpose(image)
+        image.thumbnail((THUMB_SIZE, THUMB_SIZE))
+        image.convert("RGB").save(target + ".tmp", "JPEG", quality=85, optimize=True)
+    os.replace(target + ".tmp", target)
+    return target
+
+
+class MediaStore:
+    # Локальная картинка загружается в Telegram один раз, дальше отправляется ее file_id.
+    # Ключ - хэш содержимого: переименование файла или повторный импорт
+    # той же картинки новой загрузки не вызывают.
+    def __init__(self):
+        # хэш содержимого -> file_id
+        self.file_ids: dict[str, str] = {}
+        # путь -> (mtime, размер, хэш), чтобы не читать файл при каждом показе
+        self.hashes: dict[str, tuple] = {}
+        # Загрузки в процессе: хэш -> (задача-загрузчик, future с file_id).
+        # Второй показ того же файла ждет первую загрузку, а не загружает его заново.
+        self.uploading: dict[str, tuple] = {}
+
+    async def setup(self, session_pool: async_sessionmaker) -> int:
+        async with session_pool() as session:
+            rows = await orm_get_media_files(session)
+        self.file_ids = {row.content_hash: row.file_id for row in rows}
+        return len(self.file_ids)
+
+    def _content_hash(self, path: str) -> str:
+        stat = os.stat(path)
+        cached = self.hashes.get(path)
+        if cached is not None and cached[:2] == (stat.st_mtime, stat.st_size):
+            return cached[2]
+        content_hash = file_hash(path)
+        self.hashes[path] = (stat.st_mtime, stat.st_size, content_hash)
+        return content_hash
+
+    def _read(self, path: str, content_hash: str) -> BufferedInputFile:
+        upload = make_thumbnail(path, content_hash)
+        with open(upload, "rb") as file:
+            data = file.read()
+        # По имени файла remember() узнает, чей file_id вернул Telegram
+        return BufferedInputFile(data, filename=content_hash + os.path.splitext(upload)[1])
+
+    async def resolve(self, image: str | None) -> str | BufferedInputFile:
+        # file_id для отправки или файл для первой загрузки.
+        # Картинки нет (например, у нового баннера) - показываем заглушку.
+        if not image:
+            image = PLACEHOLDER
+        if not is_local(image):
+            return image
+        if not os.path.isabs(image):
+            image = os.path.join(BASE_DIR, image)
+        content_hash = await asyncio.to_thread(self._content_hash, image)
+        task = asyncio.current_task()
+        while True:
+            file_id = self.file_ids.get(content_hash)
+            if file_id is not None:
+                return file_id
+            pending = self.uploading.get(content_hash)
+            # Своя же загрузка (тот же файл дважды в одном альбоме) ждать не может
+            if pending is None or pending[0] is task:
+                break
+            try:
+                file_id = await asyncio.wait_for(asyncio.shield(pending[1]), UPLOAD_WAIT)
+            except asyncio.TimeoutError:
+                # Загрузчик не отправил файл (например, упал хендлер) - загружаем сами
+                break
+            if file_id is not None:
+                return file_id
+        self.uploading[content_hash] = (task, asyncio.get_running_loop().create_future())
+        return await asyncio.to_thread(self._read, image, content_hash)
+
+    async def remember(self, session: AsyncSession, media, message: Message | bool | None):
+        # Вызывается после отправки: запоминаем file_id загруженного файла.
+        # Пишем в сессии запроса - вторая сессия рядом с ее транзакцией
+        # упиралась бы в блокировку SQLite.
+        if not isinstance(media, BufferedInputFile):
+            return
+        content_hash = os.path.splitext(media.filename)[0]
+        pending = self.uploading.pop(content_hash, None)
+        file_id = message.photo[-1].file_id if isinstance(message, Message) and message.photo else None
+        if pending is not None and not pending[1].done():
+            # Ждущие показы получают file_id сразу (а при неудаче - загружают сами)
+            pending[1].set_result(file_id)
+        if file_id is None or content_hash in self.file_ids:
+            return
+        await orm_add_media_file(session, content_hash, file_id)
+        # В кэш процесса - только после коммита, чтобы откат не оставил file_id без строки в БД
+        _after_commit(session, lambda: self.file_ids.__setitem__(content_hash, file_id))
+
+    async def upload(self, bot: Bot, session: AsyncSession, chat_id: int, path: str) -> str:
+        # Предварительная загрузка без показа пользователю: отправляем и сразу удаляем
+        media = await self.resolve(path)
+        if isinstance(media, str):
+            return media
+        message = await bot.send_photo(chat_id, media, disable_notification=True)
+        await self.remember(session, media, message)
+        await bot.delete_message(chat_id, message.message_id)
+        return message.photo[-1].file_id
+
+    async def import_directory(self, bot: Bot, session: AsyncSession, chat_id: int, directory: str) -> dict[str, str]:
+        # Все картинки каталога (с подкаталогами): путь -> file_id
+        result = {}
+        for root, dirs, files in os.walk(directory):
+            dirs[:] = [name for name in dirs if not name.startswith(".")]
+            for name in sorted(files):
+                if is_local(name):
+                    path = os.path.relpath(os.path.join(root, name), BASE_DIR)
+                    result[path] = await self.upload(bot, session, chat_id, path)
+        return result
+
+
+media_store = MediaStore()
+
+
+async def photo(image: str | None, caption: str | None = None) -> InputMediaPhoto:
+    return InputMediaPhoto(media=await media_store.resolve(image), caption=caption)
+
+
+async def main(command: str, directory: str):
+    # python -m common.media upload <каталог> - загрузить все картинки заранее
+    # python -m common.media banners <каталог> - картинки баннеров по имени файла
+    #   (main.jpg, about.jpg, catalog.jpg, cart.jpg, payment.jpg)
+    # Загрузка идет в чат MEDIA_CHAT_ID (например, личка админа с ботом).
+    from dotenv import find_dotenv, load_dotenv
+    load_dotenv(find_dotenv())
+
+    from database.engine import create_db, session_maker
+    from database.orm_query import orm_change_banner_image
+
+    await create_db()
+    await media_store.setup(session_maker)
+    bot = Bot(token=os.getenv("TOKEN"))
+    try:
+        async with session_maker() as session:
+            uploaded = await media_store.import_directory(
+                bot, session, int(os.environ["MEDIA_CHAT_ID"]), directory
+            )
+            if command == "banners":
+                for path in uploaded:
+                    name = os.path.splitext(os.path.basename(path))[0]
+                    await orm_change_banner_image(session, name, path)
+        print(f"Картинок: {len(uploaded)}, уникальных загружено: {len(set(uploaded.values()))}")
+    finally:
+        await bot.session.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main(sys.argv[1], sys.argv[2]))
@@ -0,0 +1,10 @@
+import asyncio
+import contextvars
+
+
+def create_background_task(coro) -> asyncio.Task:
+    # Задача, созданная внутри апдейта, копирует его контекст: замеры метрик,
+    # профилировщик SQL и сессия апдейта продолжали бы считать ее запросы своими.
+    # Долгие фоновые задачи (рассылка, запись FSM, обновление админов) запускаем
+    # с пустым контекстом.
+    return contextvars.Context().run(asyncio.create_task, coro)
@@ -0,0 +1,101 @@
+import re
+import unicodedata
+
+
+# Похожие символы приводим к одному виду (латиница и цифры -> кириллица),
+# чтобы "сп@м", "cпам" (латинская c) и "спам" считались одинаковыми
+HOMOGLYPHS = str.maketrans({
+    "a": "а", "@": "а", "4": "ч",
+    "b": "в", "6": "б",
+    "c": "с", "e": "е", "3": "з",
+    "h": "н", "k": "к", "m": "м",
+    "o": "о", "0": "о", "p": "р",
+    "t": "т", "x": "х", "y": "у",
+    "1": "і", "l": "і", "i": "і", "ї": "і",
+    "$": "ѕ", "s": "ѕ",
+})
+
+# Все, что не буква и не цифра: пробелы, пунктуация, эмодзи - границы слов
+SEPARATORS = re.compile(r"[\W_]+")
+# Замаскированное слово: одиночные (в том числе растянутые) символы через точку, дефис, "_" или "*" ("с.п.а.м")
+OBFUSCATED = re.compile(r"(?<![^\W_])([^\W_])\1*(?:[._*-]+([^\W_])\2*)+(?![^\W_])")
+OBFUSCATION_MARKS = re.compile(r"[._*-]+")
+# Растянутые буквы: "спааам" -> "спам"
+REPEATS = re.compile(r"(.)\1+")
+
+
+def normalize(text: str) -> str:
+    # Слова текста через один пробел. Разделители склеиваются только внутри
+    # замаскированных слов, иначе "ус памяти" превратилось бы в "успамяти".
+    # Убираем диакритику и "хитрые" формы Unicode (полноширинные, надстрочные и т.п.)
+    text = unicodedata.normalize("NFKD", text)
+    text = "".join(char for char in text if not unicodedata.combining(char))
+    text = text.casefold().translate(HOMOGLYPHS)
+    text = OBFUSCATED.sub(lambda match: OBFUSCATION_MARKS.sub("", match.group()), text)
+    text = SEPARATORS.sub(" ", text).strip()
+    return REPEATS.sub(r"\1", text)
+
+
+class WordMatcher:
+    # Автомат Ахо-Корасик по нормализованным словам: проверка сообщения
+    # занимает время, пропорциональное длине текста, а не числу слов.
+    # Слово совпадает только целиком ("das" не найдется в "Adidas");
+    # "казино*" со звездочкой на конце ловит и слова, которые с него начинаются.
+    def __init__(self, words=()):
+        self.load(words)
+
+    def load(self, words):
+        # Новый автомат строится целиком и подменяет старый одним присваиванием
+        goto = [{}]
+        output = [()]
+        size = 0
+        for word in words:
+            prefix = word.endswith("*")
+            pattern = normalize(word)
+            if not pattern:
+                continue
+            size += 1
+            node = 0
+            for char in pattern:
+                next_node = goto[node].get(char)
+                if next_node is None:
+                    next_node = len(goto)
+                    goto[node][char] = next_node
+                    goto.append({})
+                    output.append(())
+                node = next_node
+            output[node] += ((word, len(pattern), prefix),)
+
+        # Ссылки неудачи обходом в ширину; output наследуем по ним,
+        # чтобы совпадение находилось в любом узле без дополнительного прохода
+        fail = [0] * len(goto)
+        queue = list(goto[0].values())
+        for node in queue:
+            for char, child in goto[node].items():
+                state = fail[node]
+                while state and char not in goto[state]:
+                    state = fail[state]
+                fail[child] = goto[state].get(char, 0)
+                output[child] += output[fail[child]]
+                queue.append(child)
+
+        self.automaton = (goto, fail, output)
+        self.size = size
+
+    def find(self, text: str) -> str | None:
+        # Первое найденное запрещенное слово или None
+        goto, fail, output = self.automaton
+        text = normalize(text)
+        last = len(text) - 1
+        node = 0
+        for end, char in enumerate(text):
+            while node and char not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(char, 0)
+            for word, length, prefix in output[node]:
+                start = end - length + 1
+                if (start == 0 or text[start - 1] == " ") and (
+                    prefix or end == last or text[end + 1] == " "
+                ):
+                    return word
+        return None
@@ -0,0 +1,44 @@
+import time
+
+
+class TTLCache:
+    # Простой кэш в памяти процесса: значение живет ttl секунд или до явного сброса.
+    # maxsize ограничивает число ключей - при переполнении вытесняется самый старый.
+    def __init__(self, ttl: float = 300, maxsize: int | None = None):
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self.data = {}
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, default=None):
+        item = self.data.get(key)
+        if item is None:
+            self.misses += 1
+            return default
+        expires, value = item
+        if expires < time.monotonic():
+            del self.data[key]
+            self.misses += 1
+            return default
+        self.hits += 1
+        return value
+
+    def set(self, key, value):
+        self.data.pop(key, None)
+        if self.maxsize is not None and len(self.data) >= self.maxsize:
+            del self.data[next(iter(self.data))]
+        self.data[key] = (time.monotonic() + self.ttl, value)
+
+    def __contains__(self, key):
+        item = self.data.get(key)
+        return item is not None and item[0] >= time.monotonic()
+
+    def pop(self, key):
+        self.data.pop(key, None)
+
+    def clear(self):
+        self.data.clear()
+
+    def stats(self):
+        return {"size": len(self.data), "hits": self.hits, "misses": self.misses}
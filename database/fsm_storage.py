@@ -0,0 +1,209 @@
+import asyncio
+import json
+import os
+import time
+from collections import OrderedDict
+from functools import partial
+from typing import Any, Mapping
+
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import DEFAULT_DESTINY, BaseStorage, StateType, StorageKey
+from aiogram.fsm.storage.memory import MemoryStorage
+from sqlalchemy import delete, insert, select, update
+from sqlalchemy.ext.asyncio import async_sessionmaker
+
+from common.tasks import create_background_task
+from database.models import FsmRecord
+
+
+def build_key(key: StorageKey) -> str:
+    # Тот же ключ, что строит DefaultKeyBuilder() из aiogram: fsm:чат[:тема]:пользователь.
+    # Как и он, не принимаем destiny, отличный от default.
+    parts = ["fsm", str(key.chat_id)]
+    if key.thread_id:
+        parts.append(str(key.thread_id))
+    parts.append(str(key.user_id))
+    if key.destiny != DEFAULT_DESTINY:
+        raise ValueError("FSM storage key does not support destiny other than the default")
+    return ":".join(parts)
+
+
+class SQLAlchemyStorage(BaseStorage):
+    # Хранилище FSM в той же БД, что и каталог.
+    # Чтение идет из локального кэша, запись - отложенная: изменения копятся
+    # и раз в flush_interval секунд уходят в БД одной транзакцией.
+    # Состояния, к которым не обращались ttl секунд, удаляются из памяти и из БД.
+    # Кэш локален для процесса, поэтому несколько воркеров должны получать
+    # апдейты одного чата в один и тот же процесс (так делает webhook-режим).
+    def __init__(
+        self,
+        session_pool: async_sessionmaker,
+        ttl: float = 86400,
+        flush_interval: float = 1.0,
+        cache_size: int = 10000,
+    ):
+        self.session_pool = session_pool
+        self.ttl = ttl
+        self.flush_interval = flush_interval
+        self.cache_size = cache_size
+        # key -> [state, data, время последнего обращения]
+        self.records: OrderedDict[str, list] = OrderedDict()
+        self.dirty: set[str] = set()
+        # Ключи, которые читали после последней чистки: их строкам в БД
+        # продлеваем updated_at, чтобы expire() не удалил живое состояние
+        self.touched: set[str] = set()
+        self.stopped = asyncio.Event()
+        self.flusher: asyncio.Task | None = None
+
+    async def _load(self, key: str) -> list:
+        record = self.records.get(key)
+        now = time.time()
+        if record is not None:
+            record[2] = now
+            self.records.move_to_end(key)
+            self.touched.add(key)
+            return record
+
+        async with self.session_pool() as session:
+            result = await session.execute(
+                select(FsmRecord.state, FsmRecord.data, FsmRecord.updated_at).where(FsmRecord.key == key)
+            )
+            row = result.first()
+
+        record = self.records.get(key)
+        if record is None:
+            if row is not None and row.updated_at >= now - self.ttl:
+                record = [row.state, json.loads(row.data) if row.data else {}, now]
+                self.touched.add(key)
+            else:
+                record = [None, {}, now]
+            self.records[key] = record
+        return record
+
+    def _mark_dirty(self, key: str):
+        self.dirty.add(key)
+        if not self.stopped.is_set() and (self.flusher is None or self.flusher.done()):
+            self.flusher = create_background_task(self._flush_loop())
+
+    async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+        key = build_key(key)
+        record = await self._load(key)
+        record[0] = state.state if isinstance(state, State) else state
+        self._mark_dirty(key)
+
+    async def get_state(self, key: StorageKey) -> str | None:
+        record = await self._load(build_key(key))
+        return record[0]
+
+    async def set_data(self, key: StorageKey, data: Mapping[str, Any]) -> None:
+        key = build_key(key)
+        record = await self._load(key)
+        record[1] = dict(data)
+        self._mark_dirty(key)
+
+    async def get_data(self, key: StorageKey) -> dict[str, Any]:
+        record = await self._load(build_key(key))
+        return dict(record[1])
+
+    async def flush(self):
+        if not self.dirty:
+            return
+        keys, self.dirty = self.dirty, set()
+        rows = []
+        for key in keys:
+            state, data, last_used = self.records[key]
+            if state is not None or data:
+                # default=str - цена из Numeric приходит как Decimal
+                rows.append({
+                    "key": key,
+                    "state": state,
+                    "data": json.dumps(data, default=str, ensure_ascii=False),
+                    "updated_at": last_used,
+                })
+        try:
+            async with self.session_pool() as session:
+                await session.execute(delete(FsmRecord).where(FsmRecord.key.in_(keys)))
+                if rows:
+                    await session.execute(insert(FsmRecord), rows)
+                await session.commit()
+        except BaseException:
+            # Не теряем изменения (в том числе при отмене) - повторим при следующем сбросе
+            self.dirty |= keys
+            raise
+
+    async def expire(self):
+        # Чистим брошенные сценарии: в памяти и в БД
+        now = time.time()
+        cutoff = now - self.ttl
+        touched, self.touched = self.touched, set()
+        touched = [key for key in touched if key in self.records and key not in self.dirty]
+        for key in [key for key, record in self.records.items() if record[2] < cutoff]:
+            if key not in self.dirty:
+                del self.records[key]
+        while len(self.records) > self.cache_size:
+            key = next(iter(self.records))
+            if key in self.dirty:
+                break
+            del self.records[key]
+        async with self.session_pool() as session:
+            # Строки, которые только читали, в БД не перезаписывались - продлеваем их
+            for i in range(0, len(touched), 500):
+                await session.execute(
+                    update(FsmRecord).where(FsmRecord.key.in_(touched[i:i + 500])).values(updated_at=now)
+                )
+            await session.execute(delete(FsmRecord).where(FsmRecord.updated_at < cutoff))
+            await session.commit()
+
+    async def _flush_loop(self):
+        last_expire = time.monotonic()
+        while not self.stopped.is_set():
+            try:
+                await asyncio.wait_for(self.stopped.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            try:
+                await self.flush()
+                if time.monotonic() - last_expire > min(self.ttl, 600):
+                    await self.expire()
+                    last_expire = time.monotonic()
+            except Exception as e:
+                print(f"Ошибка записи FSM: {e}")
+
+    async def close(self) -> None:
+        # Останавливаем цикл и дожидаемся текущего сброса, а не отменяем его
+        # посреди транзакции; затем сбрасываем то, что накопилось последним
+        self.stopped.set()
+        if self.flusher is not None:
+            await self.flusher
+        await self.flush()
+
+
+def create_fsm_storage(session_pool: async_sessionmaker) -> BaseStorage:
+    # FSM_STORAGE=sql (по умолчанию) | redis | memory
+    # FSM_TTL - через сколько секунд простоя состояние удаляется
+    kind = os.getenv("FSM_STORAGE", "sql")
+    ttl = int(os.getenv("FSM_TTL", 86400))
+
+    if kind == "memory":
+        return MemoryStorage()
+
+    if kind == "redis":
+        # Нужен пакет redis. Подойдет любой сервер с протоколом Redis.
+        # Записи здесь не пакетируются: каждая - отдельная команда SET с EX
+        # (доли миллисекунды, зато ничего не теряется при падении процесса),
+        # истечение делает сам сервер. Отложенная пакетная запись - только у SQL-хранилища.
+        from aiogram.fsm.storage.redis import RedisStorage
+
+        return RedisStorage.from_url(
+            os.getenv("FSM_REDIS_URL", "redis://localhost:6379/0"),
+            state_ttl=ttl,
+            data_ttl=ttl,
+            # Как и в SQL-хранилище: Decimal и прочее нестандартное - строкой
+            json_dumps=partial(json.dumps, default=str),
+        )
+
+    return SQLAlchemyStorage(
+        session_pool,
+        ttl=ttl,
+        flush_interval=float(os.getenv("FSM_FLUSH_INTERVAL", 1.0)),
+    )
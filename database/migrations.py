@@ -0,0 +1,103 @@
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+
+# Версионные миграции схемы. create_all создает только отсутствующие таблицы,
+# а изменения существующих таблиц добавляются сюда новой записью в конец списка.
+# SQL должен работать и на SQLite, и на PostgreSQL. Если это невозможно,
+# вместо строки пишется словарь {диалект: [SQL, ...]}.
+MIGRATIONS = [
+    (
+        1,
+        "индекс товаров по категории и статусу",
+        [
+            "CREATE INDEX IF NOT EXISTS ix_product_category_status ON product (category_id, status)",
+        ],
+    ),
+    (
+        2,
+        "уникальный индекс корзины (user_id, product_id)",
+        [
+            # Сначала схлопываем дубли, которые могли появиться до уникального индекса
+            "UPDATE cart SET quantity = ("
+            " SELECT SUM(c2.quantity) FROM cart c2"
+            " WHERE c2.user_id = cart.user_id AND c2.product_id = cart.product_id"
+            ") WHERE id IN ("
+            " SELECT MIN(id) FROM cart GROUP BY user_id, product_id HAVING COUNT(*) > 1"
+            ")",
+            "DELETE FROM cart WHERE id NOT IN ("
+            " SELECT MIN(id) FROM cart GROUP BY user_id, product_id"
+            ")",
+            "CREATE UNIQUE INDEX IF NOT EXISTS uq_cart_user_product ON cart (user_id, product_id)",
+        ],
+    ),
+    (
+        3,
+        "полнотекстовый поиск товаров",
+        [
+            {
+                # Внешний индекс FTS5 над product, синхронизируется триггерами
+                # при любой записи в product (orm_add/update/delete_product, каскады)
+                "sqlite": [
+                    "CREATE VIRTUAL TABLE IF NOT EXISTS product_fts USING fts5("
+                    " name, description, content='product', content_rowid='id',"
+                    " tokenize='unicode61 remove_diacritics 2')",
+                    "CREATE TRIGGER IF NOT EXISTS product_fts_insert AFTER INSERT ON product BEGIN"
+                    " INSERT INTO product_fts (rowid, name, description)"
+                    " VALUES (new.id, new.name, new.description); END",
+                    "CREATE TRIGGER IF NOT EXISTS product_fts_delete AFTER DELETE ON product BEGIN"
+                    " INSERT INTO product_fts (product_fts, rowid, name, description)"
+                    " VALUES ('delete', old.id, old.name, old.description); END",
+                    "CREATE TRIGGER IF NOT EXISTS product_fts_update AFTER UPDATE OF name, description ON product BEGIN"
+                    " INSERT INTO product_fts (product_fts, rowid, name, description)"
+                    " VALUES ('delete', old.id, old.name, old.description);"
+                    " INSERT INTO product_fts (rowid, name, description)"
+                    " VALUES (new.id, new.name, new.description); END",
+                    "INSERT INTO product_fts (product_fts) VALUES ('rebuild')",
+                ],
+                # Вычисляемый tsvector (название весомее описания) и GIN-индекс по нему
+                "postgresql": [
+                    "ALTER TABLE product ADD COLUMN IF NOT EXISTS search tsvector"
+                    " GENERATED ALWAYS AS ("
+                    " setweight(to_tsvector('russian', coalesce(name, '')), 'A') ||"
+                    " setweight(to_tsvector('russian', coalesce(description, '')), 'B')"
+                    ") STORED",
+                    "CREATE INDEX IF NOT EXISTS ix_product_search ON product USING GIN (search)",
+                ],
+            },
+        ],
+    ),
+]
+
+
+async def get_schema_version(engine: AsyncEngine) -> int:
+    async with engine.begin() as conn:
+        await conn.execute(text(
+            "CREATE TABLE IF NOT EXISTS schema_version ("
+            " version INTEGER PRIMARY KEY,"
+            " description VARCHAR(200) NOT NULL"
+            ")"
+        ))
+        result = await conn.execute(text("SELECT MAX(version) FROM schema_version"))
+        return result.scalar() or 0
+
+
+async def run_migrations(engine: AsyncEngine):
+    current = await get_schema_version(engine)
+
+    for version, description, statements in MIGRATIONS:
+        if version <= current:
+            continue
+        # Каждая миграция - отдельная транзакция вместе с записью версии
+        async with engine.begin() as conn:
+            for statement in statements:
+                if isinstance(statement, dict):
+                    for dialect_statement in statement.get(conn.dialect.name, []):
+                        await conn.execute(text(dialect_statement))
+                else:
+                    await conn.execute(text(statement))
+            await conn.execute(
+                text("INSERT INTO schema_version (version, description) VALUES (:version, :description)"),
+                {"version": version, "description": description},
+            )
+        print(f"Миграция {version} применена: {description}")
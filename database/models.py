@@ -1,6 +1,6 @@
 
 from sqlalchemy.orm import DeclarativeBase, Mapped, mapped_column, relationship
-from sqlalchemy import BigInteger, String, Text, Float, DateTime, ForeignKey, Numeric
+from sqlalchemy import BigInteger, String, Text, Float, DateTime, ForeignKey, Index, Numeric
 from datetime import datetime
 
 
@@ -26,6 +26,8 @@ class Category(Base):
 
 class Product(Base):
     __tablename__ = 'product'
+    # Меню выбирает товары по категории и статусу (см. database/migrations.py)
+    __table_args__ = (Index('ix_product_category_status', 'category_id', 'status'),)
 
     id: Mapped[int] = mapped_column(primary_key=True, autoincrement=True)
     name: Mapped[str] = mapped_column(String(100), nullable=False)
@@ -48,8 +50,69 @@ class User(Base):
     phone: Mapped[str]  = mapped_column(String(13), nullable=True)
 
 
+class RestrictedWord(Base):
+    # Запрещенные слова для чистки групп (см. common/word_filter.py)
+    __tablename__ = 'restricted_word'
+
+    id: Mapped[int] = mapped_column(primary_key=True, autoincrement=True)
+    word: Mapped[str] = mapped_column(String(100), unique=True, nullable=False)
+
+
+class ChatAdmin(Base):
+    # Админы групп (см. common/admins.py), чтобы после перезапуска не ждать /admin
+    __tablename__ = 'chat_admin'
+
+    chat_id: Mapped[int] = mapped_column(BigInteger, primary_key=True)
+    user_id: Mapped[int] = mapped_column(BigInteger, primary_key=True)
+
+
+class MediaFile(Base):
+    # file_id загруженных локальных картинок по хэшу содержимого (см. common/media.py)
+    __tablename__ = 'media_file'
+
+    content_hash: Mapped[str] = mapped_column(String(64), primary_key=True)
+    file_id: Mapped[str] = mapped_column(String(150), nullable=False)
+
+
+class Broadcast(Base):
+    # Рассылка всем пользователям. last_user_id - точка, с которой продолжаем после перезапуска
+    __tablename__ = 'broadcast'
+
+    id: Mapped[int] = mapped_column(primary_key=True, autoincrement=True)
+    from_chat_id: Mapped[int] = mapped_column(BigInteger, nullable=False)
+    message_id: Mapped[int] = mapped_column(nullable=False)
+    status_message_id: Mapped[int] = mapped_column(nullable=True)
+    status: Mapped[str] = mapped_column(String(20), default="running", nullable=False)
+    last_user_id: Mapped[int] = mapped_column(BigInteger, default=0, nullable=False)
+    delivered: Mapped[int] = mapped_column(default=0, nullable=False)
+    failed: Mapped[int] = mapped_column(default=0, nullable=False)
+    blocked: Mapped[int] = mapped_column(default=0, nullable=False)
+
+
+class CacheVersion(Base):
+    # Единственная строка (id=1): номер версии каталога и баннеров. Растет при каждом
+    # изменении из админки, по нему процессы бота сбрасывают свои кэши (см. orm_query)
+    __tablename__ = 'cache_version'
+
+    id: Mapped[int] = mapped_column(primary_key=True)
+    version: Mapped[int] = mapped_column(default=0, nullable=False)
+
+
+class FsmRecord(Base):
+    # Состояния FSM (регистрация, AddProduct и т.д.) - см. database/fsm_storage.py
+    __tablename__ = 'fsm_record'
+
+    key: Mapped[str] = mapped_column(String(200), primary_key=True)
+    state: Mapped[str] = mapped_column(String(200), nullable=True)
+    data: Mapped[str] = mapped_column(Text, nullable=True)
+    updated_at: Mapped[float] = mapped_column(Float, nullable=False, index=True)
+
+
 class Cart(Base):
     __tablename__ = 'cart'
+    # Одна строка корзины на пару (пользователь, товар) - на ней держится upsert.
+    # Индекс также обслуживает выборку корзины по user_id (см. database/migrations.py)
+    __table_args__ = (Index('uq_cart_user_product', 'user_id', 'product_id', unique=True),)
 
     id: Mapped[int] = mapped_column(primary_key=True, autoincrement=True)
     user_id: Mapped[int] = mapped_column(ForeignKey('user.user_id', ondelete='CASCADE'), nullable=False)
@@ -1,8 +1,13 @@
 import math
-from sqlalchemy import select, update, delete
+import os
+import re
+import time
+from sqlalchemy import Float, Integer, func, literal_column, or_, select, text, update, delete
 from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.dialects import postgresql, sqlite
 from sqlalchemy.orm import joinedload
-from database.models import Banner, Cart, Category, Product, User
+from database.cache import TTLCache
+from database.models import Banner, Broadcast, CacheVersion, Cart, Category, ChatAdmin, MediaFile, Product, RestrictedWord, User
 
 
 class Paginator:
@@ -44,10 +49,110 @@ class Paginator:
             self.page -= 1
             return self.__get_slice()
         raise IndexError(f'Previous page does not exist. Use has_previous() to check before.')
-    
+
+
+async def _commit(session: AsyncSession):
+    # В режиме "единица работы" транзакцией владеет middleware DataBaseSession:
+    # здесь только отправляем изменения в БД, коммит будет один на весь апдейт.
+    if session.info.get("unit_of_work"):
+        await session.flush()
+    else:
+        await session.commit()
+
+
+def _after_commit(session: AsyncSession, callback):
+    # Обновление кэшей откладываем до реального коммита, чтобы откат их не испортил
+    if session.info.get("unit_of_work"):
+        session.info.setdefault("after_commit", []).append(callback)
+    else:
+        callback()
+
+
+class QueryPage:
+    # Страница результатов, посчитанная на стороне БД (LIMIT/OFFSET + COUNT).
+    # Интерфейс has_next/has_previous совпадает с Paginator.
+    def __init__(self, items: list | tuple, page: int, pages: int, total: int):
+        self.items = items
+        self.page = page
+        self.pages = pages
+        self.total = total
+
+    def get_page(self):
+        return self.items
+
+    def has_next(self):
+        if self.page < self.pages:
+            return self.page + 1
+        return False
+
+    def has_previous(self):
+        if self.page > 1:
+            return self.page - 1
+        return False
+
+
+async def orm_paginate(session: AsyncSession, query, page: int = 1, per_page: int = 1):
+    # Считаем только количество строк, а из таблицы читаем одну страницу
+    count_query = select(func.count()).select_from(query.order_by(None).subquery())
+    total = (await session.execute(count_query)).scalar_one()
+    pages = math.ceil(total / per_page)
+    # Если товар удалили и страница "уехала" - показываем последнюю
+    page = max(1, min(page or 1, pages or 1))
+    if not total:
+        return QueryPage([], page, pages, total)
+    result = await session.execute(query.limit(per_page).offset((page - 1) * per_page))
+    return QueryPage(result.scalars().all(), page, pages, total)
+
 
 ############### Работа с баннерами (информационными страницами) ###############
 
+# Кэши баннеров и категорий. TTL - страховка на случай записи в обход админки.
+CACHE_TTL = int(os.getenv("CACHE_TTL", 300))
+banners_cache = TTLCache(ttl=CACHE_TTL)
+categories_cache = TTLCache(ttl=CACHE_TTL)
+# Готовые экраны меню уровней 0-2 (см. handlers/menu_processing.py)
+screens_cache = TTLCache(ttl=CACHE_TTL, maxsize=5000)
+MISSING = object()
+
+
+def invalidate_screens_cache():
+    screens_cache.clear()
+
+
+# Кэши живут в памяти процесса, а webhook-воркеров может быть несколько:
+# сброс после правки в админке видит только воркер, который ее обработал.
+# Поэтому каждая правка увеличивает общий счетчик cache_version в БД, а процесс
+# сверяется с ним не чаще раза в CACHE_VERSION_INTERVAL секунд и при расхождении
+# сбрасывает свои кэши. Остальные воркеры отстают не больше чем на этот интервал.
+CACHE_VERSION_INTERVAL = float(os.getenv("CACHE_VERSION_INTERVAL", 5))
+cache_version = {"seen": None, "checked": 0.0}
+
+
+async def orm_init_cache_version(session: AsyncSession):
+    if await session.get(CacheVersion, 1) is None:
+        session.add(CacheVersion(id=1, version=0))
+        await _commit(session)
+
+
+async def _bump_cache_version(session: AsyncSession):
+    # В той же транзакции, что и сама правка
+    query = update(CacheVersion).where(CacheVersion.id == 1).values(version=CacheVersion.version + 1)
+    await session.execute(query)
+
+
+async def orm_check_cache_version(session: AsyncSession):
+    now = time.monotonic()
+    if now - cache_version["checked"] < CACHE_VERSION_INTERVAL:
+        return
+    cache_version["checked"] = now
+    version = await session.scalar(select(CacheVersion.version).where(CacheVersion.id == 1))
+    if version != cache_version["seen"]:
+        cache_version["seen"] = version
+        invalidate_screens_cache()
+        invalidate_banners_cache()
+        invalidate_categories_cache()
+
+
 async def orm_add_banner_description(session: AsyncSession, data: dict):
     #Добавляем новый или изменяем существующий по именам
     #пунктов меню: main, about, cart, shipping, payment, catalog
@@ -56,19 +161,36 @@ async def orm_add_banner_description(session: AsyncSession, data: dict):
     if result.first():
         return
     session.add_all([Banner(name=name, description=description) for name, description in data.items()]) 
-    await session.commit()
+    await _commit(session)
 
 
 async def orm_change_banner_image(session: AsyncSession, name: str, image: str):
     query = update(Banner).where(Banner.name == name).values(image=image)
     await session.execute(query)
-    await session.commit()
+    await _bump_cache_version(session)
+    await _commit(session)
+    # Кэши сбрасываем после коммита: иначе рендер во время коммита закэшировал бы старый баннер
+    _after_commit(session, lambda: (invalidate_banners_cache(name), invalidate_screens_cache()))
 
 
 async def orm_get_banner(session: AsyncSession, page: str):
-    query = select(Banner).where(Banner.name == page)
+    # Баннеры меняются только из админки - отдаем из кэша.
+    # В кэше лежат строки (name, image, description), а не ORM-объекты сессии.
+    banner = banners_cache.get(page, MISSING)
+    if banner is not MISSING:
+        return banner
+    query = select(Banner.name, Banner.image, Banner.description).where(Banner.name == page)
     result = await session.execute(query)
-    return result.scalar()
+    banner = result.first()
+    banners_cache.set(page, banner)
+    return banner
+
+
+def invalidate_banners_cache(name: str | None = None):
+    if name is None:
+        banners_cache.clear()
+    else:
+        banners_cache.pop(name)
 
 
 async def orm_get_info_pages(session: AsyncSession):
@@ -80,9 +202,18 @@ async def orm_get_info_pages(session: AsyncSession):
 ############################ Категории ######################################
 
 async def orm_get_categories(session: AsyncSession):
-    query = select(Category)
+    categories = categories_cache.get("all")
+    if categories is not None:
+        return categories
+    query = select(Category.id, Category.name).order_by(Category.id)
     result = await session.execute(query)
-    return result.scalars().all()
+    categories = result.all()
+    categories_cache.set("all", categories)
+    return categories
+
+
+def invalidate_categories_cache():
+    categories_cache.clear()
 
 async def orm_create_categories(session: AsyncSession, categories: list):
     query = select(Category)
@@ -90,7 +221,7 @@ async def orm_create_categories(session: AsyncSession, categories: list):
     if result.first():
         return
     session.add_all([Category(name=name) for name in categories]) 
-    await session.commit()
+    await _commit(session)
 
 
 
@@ -105,8 +236,9 @@ async def orm_add_product(session: AsyncSession, data: dict):
         category_id = int(data["category"]),
     )
     session.add(obj)
-    
-    await session.commit()
+    await _bump_cache_version(session)
+    await _commit(session)
+    _after_commit(session, invalidate_screens_cache)
 # Тут пытался решиться с чатиком 1.
 async def orm_get_products(session: AsyncSession, category_id, include_busy=False):
     query = select(Product).where(Product.category_id == category_id)
@@ -118,6 +250,21 @@ async def orm_get_products(session: AsyncSession, category_id, include_busy=Fals
     return result.scalars().all()
 
 
+async def orm_get_products_page(
+    session: AsyncSession,
+    category_id: int,
+    page: int = 1,
+    per_page: int = 1,
+    include_busy: bool = False,
+):
+    query = select(Product).where(Product.category_id == category_id).order_by(Product.id)
+
+    if not include_busy:
+        query = query.where(Product.status != "занят")
+
+    return await orm_paginate(session, query, page=page, per_page=per_page)
+
+
 async def orm_get_product(session: AsyncSession, product_id: int):
     query = select(Product).where(Product.id == product_id)
     result = await session.execute(query)
@@ -135,18 +282,92 @@ async def orm_update_product(session: AsyncSession, product_id: int, data):
         )
     )
     await session.execute(query)
-    await session.commit()
+    await _bump_cache_version(session)
+    await _commit(session)
+    _after_commit(session, invalidate_screens_cache)
 
 
 async def orm_delete_product(session: AsyncSession, product_id: int):
     query = delete(Product).where(Product.id == product_id)
     await session.execute(query)
-    await session.commit()
+    await _bump_cache_version(session)
+    await _commit(session)
+    _after_commit(session, invalidate_screens_cache)
+
+
+
+# Поиск по названию и описанию (inline-режим). Индекс создает миграция 3:
+# FTS5 в SQLite, tsvector + GIN в PostgreSQL. Каждое слово запроса ищется
+# как префикс, чтобы результаты появлялись по мере набора.
+SEARCH_WORD = re.compile(r"\w+")
+
+
+async def orm_search_products(session: AsyncSession, text_query: str, offset: int = 0, limit: int = 20):
+    words = SEARCH_WORD.findall(text_query.lower())[:10]
+    if not words:
+        return []
+    dialect = session.bind.dialect.name
+
+    if dialect == "sqlite":
+        # bm25: меньше - лучше, совпадение в названии в 10 раз важнее описания
+        match = " ".join(f'"{word}"*' for word in words)
+        fts = (
+            text(
+                "SELECT rowid, bm25(product_fts, 10.0, 1.0) AS rank"
+                " FROM product_fts WHERE product_fts MATCH :match"
+            )
+            .bindparams(match=match)
+            .columns(rowid=Integer, rank=Float)
+            .subquery()
+        )
+        query = select(Product).join(fts, fts.c.rowid == Product.id).order_by(fts.c.rank, Product.id)
+    elif dialect == "postgresql":
+        tsquery = func.to_tsquery("russian", " & ".join(f"{word}:*" for word in words))
+        search = literal_column("product.search")
+        query = (
+            select(Product)
+            .where(search.op("@@")(tsquery))
+            .order_by(func.ts_rank_cd(search, tsquery).desc(), Product.id)
+        )
+    else:
+        # Без полнотекстового индекса - простой поиск подстрок
+        query = select(Product).order_by(Product.id)
+        for word in words:
+            pattern = f"%{word}%"
+            query = query.where(or_(Product.name.ilike(pattern), Product.description.ilike(pattern)))
 
+    query = query.where(Product.status != "занят").offset(offset).limit(limit)
+    result = await session.execute(query)
+    return result.scalars().all()
 
 
 ##################### Добавляем юзера в БД #####################################
 
+# Кэш уже записанных в БД пользователей: user_id -> (first_name, last_name, phone).
+# Повторный вызов orm_add_user с теми же данными не идет в БД.
+known_users: dict[int, tuple] = {}
+# Пользователи, завершившие регистрацию (с телефоном). Прогревается из БД при старте.
+registered_users: set[int] = set()
+
+
+def _remember_user(user_id: int, fields: tuple):
+    known_users[user_id] = fields
+    if fields[2] is not None:
+        registered_users.add(user_id)
+
+
+async def orm_warm_user_caches(session: AsyncSession, batch_size: int = 1000):
+    # Потоковая загрузка пользователей порциями, без .all() по всей таблице
+    query = select(User.user_id, User.first_name, User.last_name, User.phone)
+    result = await session.stream(query.execution_options(yield_per=batch_size))
+    count = 0
+    async for rows in result.partitions():
+        for user_id, first_name, last_name, phone in rows:
+            _remember_user(user_id, (first_name, last_name, phone))
+        count += len(rows)
+    return count
+
+
 async def orm_add_user(
     session: AsyncSession,
     user_id: int,
@@ -155,46 +376,266 @@ async def orm_add_user(
     last_name: str | None = None,
     phone: str | None = None,
 ):
-    # Поиск пользователя по user_id
-    query = select(User).where(User.user_id == user_id)
-    result = await session.execute(query)
-    existing_user = result.scalars().first()
-
-    if existing_user is None:
-        # Если пользователь не найден, создаем нового
-        new_user = User(
-            user_id=user_id,
-            #tg_name = tg_name,
-            first_name=first_name,
-            last_name=last_name,
-            phone=phone
+    # None означает "не менять" - телефон больше не затирается при добавлении в корзину
+    fields = {"first_name": first_name, "last_name": last_name, "phone": phone}
+    cached = known_users.get(user_id)
+    if cached is not None:
+        merged = tuple(
+            new if new is not None else old for new, old in zip(fields.values(), cached)
+        )
+        if merged == cached:
+            return
+    else:
+        merged = None
+
+    insert = _dialect_insert(session)
+    if insert is None:
+        # Запасной путь для БД без ON CONFLICT
+        query = select(User).where(User.user_id == user_id)
+        result = await session.execute(query)
+        existing_user = result.scalars().first()
+        if existing_user is None:
+            existing_user = User(user_id=user_id, **fields)
+            session.add(existing_user)
+        else:
+            for name, value in fields.items():
+                if value is not None and getattr(existing_user, name) != value:
+                    setattr(existing_user, name, value)
+        if session.dirty or session.new:
+            await _commit(session)
+        merged = (existing_user.first_name, existing_user.last_name, existing_user.phone)
+        _after_commit(session, lambda: _remember_user(user_id, merged))
+        return
+
+    # INSERT ... ON CONFLICT DO UPDATE, который пишет только если поля изменились
+    query = insert(User).values(user_id=user_id, **fields)
+    changed = [
+        query.excluded[name].is_not(None) & query.excluded[name].is_distinct_from(getattr(User, name))
+        for name in fields
+    ]
+    query = query.on_conflict_do_update(
+        index_elements=[User.user_id],
+        set_={
+            name: func.coalesce(query.excluded[name], getattr(User, name))
+            for name in fields
+        },
+        where=or_(*changed),
+    )
+    await session.execute(query)
+    await _commit(session)
+
+    if merged is None:
+        # Пользователя не было в кэше - читаем то, что реально лежит в БД
+        result = await session.execute(
+            select(User.first_name, User.last_name, User.phone).where(User.user_id == user_id)
         )
-        session.add(new_user)
+        merged = tuple(result.one())
+    _after_commit(session, lambda: _remember_user(user_id, merged))
+
+
+async def orm_ensure_user(session: AsyncSession, user_id: int):
+    # Строка пользователя нужна для внешнего ключа корзины. Имена и телефон
+    # не трогаем: их пользователь ввел при регистрации.
+    if user_id in known_users:
+        return
+    insert = _dialect_insert(session)
+    if insert is None:
+        # Запасной путь для БД без ON CONFLICT
+        query = select(User.first_name, User.last_name, User.phone).where(User.user_id == user_id)
+        row = (await session.execute(query)).first()
+        if row is None:
+            session.add(User(user_id=user_id))
+            await _commit(session)
+            fields = (None, None, None)
+        else:
+            fields = tuple(row)
     else:
-        # Если пользователь найден, обновляем его данные
-        #existing_user.first_name = tg_name
-        existing_user.first_name = first_name
-        existing_user.last_name = last_name
-        existing_user.phone = phone
+        query = insert(User).values(user_id=user_id).on_conflict_do_nothing(index_elements=[User.user_id])
+        result = await session.execute(query)
+        await _commit(session)
+        if result.rowcount:
+            fields = (None, None, None)
+        else:
+            # Строку успел записать другой запрос или воркер - кэшируем то, что в БД
+            query = select(User.first_name, User.last_name, User.phone).where(User.user_id == user_id)
+            fields = tuple((await session.execute(query)).one())
+    _after_commit(session, lambda: _remember_user(user_id, fields))
+
+
+
+async def orm_stream_user_ids(session: AsyncSession, after_user_id: int = 0, batch_size: int = 500):
+    # Серверный курсор: получатели приходят порциями по batch_size по возрастанию user_id
+    query = (
+        select(User.user_id)
+        .where(User.user_id > after_user_id)
+        .order_by(User.user_id)
+        .execution_options(yield_per=batch_size)
+    )
+    result = await session.stream_scalars(query)
+    async for user_ids in result.partitions():
+        yield user_ids
+
 
-    # Сохраняем изменения в базе данных
-    await session.commit()
+##################### Запрещенные слова ####################################
+
+async def orm_get_restricted_words(session: AsyncSession):
+    query = select(RestrictedWord.word)
+    result = await session.execute(query)
+    return result.scalars().all()
+
+
+async def orm_create_restricted_words(session: AsyncSession, words):
+    # Начальный список из common/words.py, только если таблица пустая
+    query = select(RestrictedWord.id).limit(1)
+    result = await session.execute(query)
+    if result.first():
+        return
+    session.add_all([RestrictedWord(word=word) for word in words])
+    await _commit(session)
+
+
+async def orm_add_restricted_word(session: AsyncSession, word: str):
+    query = select(RestrictedWord.id).where(RestrictedWord.word == word)
+    result = await session.execute(query)
+    if result.first():
+        return
+    session.add(RestrictedWord(word=word))
+    await _commit(session)
+
+
+async def orm_delete_restricted_word(session: AsyncSession, word: str):
+    query = delete(RestrictedWord).where(RestrictedWord.word == word)
+    await session.execute(query)
+    await _commit(session)
+
+
+########################## Админы групп ####################################
+
+async def orm_get_chat_admins(session: AsyncSession):
+    query = select(ChatAdmin.chat_id, ChatAdmin.user_id)
+    result = await session.execute(query)
+    return result.all()
+
+
+async def orm_set_chat_admins(session: AsyncSession, chat_id: int, user_ids):
+    # Полный список админов чата заменяет сохраненный
+    await session.execute(delete(ChatAdmin).where(ChatAdmin.chat_id == chat_id))
+    session.add_all([ChatAdmin(chat_id=chat_id, user_id=user_id) for user_id in user_ids])
+    await _commit(session)
+
+
+async def orm_add_chat_admin(session: AsyncSession, chat_id: int, user_id: int):
+    query = select(ChatAdmin.user_id).where(ChatAdmin.chat_id == chat_id, ChatAdmin.user_id == user_id)
+    result = await session.execute(query)
+    if result.first():
+        return
+    session.add(ChatAdmin(chat_id=chat_id, user_id=user_id))
+    await _commit(session)
+
+
+async def orm_delete_chat_admin(session: AsyncSession, chat_id: int, user_id: int | None = None):
+    # user_id=None - забыть весь чат (бота удалили из группы)
+    query = delete(ChatAdmin).where(ChatAdmin.chat_id == chat_id)
+    if user_id is not None:
+        query = query.where(ChatAdmin.user_id == user_id)
+    await session.execute(query)
+    await _commit(session)
+
+
+########################## Картинки ########################################
+
+async def orm_get_media_files(session: AsyncSession):
+    query = select(MediaFile.content_hash, MediaFile.file_id)
+    result = await session.execute(query)
+    return result.all()
+
+
+async def orm_add_media_file(session: AsyncSession, content_hash: str, file_id: str):
+    # Тот же файл мог одновременно загрузить другой запрос - первый file_id остается
+    insert = _dialect_insert(session)
+    if insert is None:
+        # Запасной путь для БД без ON CONFLICT
+        query = select(MediaFile.file_id).where(MediaFile.content_hash == content_hash)
+        result = await session.execute(query)
+        if result.first():
+            return
+        session.add(MediaFile(content_hash=content_hash, file_id=file_id))
+    else:
+        query = insert(MediaFile).values(content_hash=content_hash, file_id=file_id)
+        await session.execute(query.on_conflict_do_nothing(index_elements=[MediaFile.content_hash]))
+    await _commit(session)
+
+
+############################ Рассылки ######################################
+
+async def orm_create_broadcast(session: AsyncSession, from_chat_id: int, message_id: int, status_message_id: int):
+    broadcast = Broadcast(
+        from_chat_id=from_chat_id,
+        message_id=message_id,
+        status_message_id=status_message_id,
+    )
+    session.add(broadcast)
+    await _commit(session)
+    return broadcast
+
+
+async def orm_get_broadcast(session: AsyncSession, broadcast_id: int):
+    query = select(Broadcast).where(Broadcast.id == broadcast_id)
+    result = await session.execute(query)
+    return result.scalar()
+
+
+async def orm_get_running_broadcasts(session: AsyncSession):
+    query = select(Broadcast.id).where(Broadcast.status == "running").order_by(Broadcast.id)
+    result = await session.execute(query)
+    return result.scalars().all()
+
+
+async def orm_save_broadcast_progress(session: AsyncSession, broadcast_id: int, **progress):
+    # progress: last_user_id, delivered, failed, blocked, status
+    query = update(Broadcast).where(Broadcast.id == broadcast_id).values(**progress)
+    await session.execute(query)
+    await _commit(session)
 
 
 
 ######################## Работа с корзинами #######################################
 
+def _dialect_insert(session: AsyncSession):
+    # insert() с поддержкой ON CONFLICT для текущей БД, либо None
+    dialect = session.bind.dialect.name
+    if dialect == "postgresql":
+        return postgresql.insert
+    if dialect == "sqlite":
+        return sqlite.insert
+    return None
+
+
 async def orm_add_to_cart(session: AsyncSession, user_id: int, product_id: int):
-    query = select(Cart).where(Cart.user_id == user_id, Cart.product_id == product_id).options(joinedload(Cart.product))
-    cart = await session.execute(query)
-    cart = cart.scalar()
-    if cart:
-        cart.quantity += 1
-        await session.commit()
-        return cart
-    else:
-        session.add(Cart(user_id=user_id, product_id=product_id, quantity=1))
-        await session.commit()
+    insert = _dialect_insert(session)
+    if insert is None:
+        # Запасной путь для БД без ON CONFLICT
+        query = select(Cart).where(Cart.user_id == user_id, Cart.product_id == product_id)
+        cart = await session.execute(query)
+        cart = cart.scalar()
+        if cart:
+            cart.quantity += 1
+        else:
+            session.add(Cart(user_id=user_id, product_id=product_id, quantity=1))
+        await _commit(session)
+        return
+
+    # INSERT ... ON CONFLICT DO UPDATE - один атомарный запрос без гонки
+    query = (
+        insert(Cart)
+        .values(user_id=user_id, product_id=product_id, quantity=1)
+        .on_conflict_do_update(
+            index_elements=[Cart.user_id, Cart.product_id],
+            set_={"quantity": Cart.quantity + 1},
+        )
+    )
+    await session.execute(query)
+    await _commit(session)
 
 async def orm_get_user_carts(session: AsyncSession, user_id):
     query = select(Cart).filter(Cart.user_id == user_id).options(joinedload(Cart.product))
@@ -202,28 +643,62 @@ async def orm_get_user_carts(session: AsyncSession, user_id):
     return result.scalars().all()
 
 
+async def orm_get_cart_summary(session: AsyncSession, user_id: int):
+    # Количество позиций и общая стоимость корзины одним запросом
+    query = (
+        select(
+            func.count(Cart.id),
+            func.coalesce(func.sum(Cart.quantity * Product.price), 0),
+        )
+        .join(Product, Cart.product_id == Product.id)
+        .where(Cart.user_id == user_id)
+    )
+    result = await session.execute(query)
+    count, total_price = result.one()
+    return count, total_price
+
+
+async def orm_get_user_cart_item(session: AsyncSession, user_id: int, page: int = 1):
+    # Одна позиция корзины по номеру страницы
+    query = (
+        select(Cart)
+        .where(Cart.user_id == user_id)
+        .options(joinedload(Cart.product))
+        .order_by(Cart.id)
+        .limit(1)
+        .offset(max(page - 1, 0))
+    )
+    result = await session.execute(query)
+    return result.scalar()
+
+
 async def orm_delete_from_cart(session: AsyncSession, user_id: int, product_id: int):
     query = delete(Cart).where(Cart.user_id == user_id, Cart.product_id == product_id)
     await session.execute(query)
-    await session.commit()
+    await _commit(session)
 
 
 async def orm_reduce_product_in_cart(session: AsyncSession, user_id: int, product_id: int):
-    query = select(Cart).where(Cart.user_id == user_id, Cart.product_id == product_id).options(joinedload(Cart.product))
-    cart = await session.execute(query)
-    cart = cart.scalar()
-
-    if not cart:
-        return
-    if cart.quantity > 1:
-        cart.quantity -= 1
-        await session.commit()
+    # Уменьшаем количество, если оно больше 1
+    query = (
+        update(Cart)
+        .where(Cart.user_id == user_id, Cart.product_id == product_id, Cart.quantity > 1)
+        .values(quantity=Cart.quantity - 1)
+        .execution_options(synchronize_session=False)
+    )
+    result = await session.execute(query)
+    if result.rowcount:
+        await _commit(session)
         return True
-    else:
-        await orm_delete_from_cart(session, user_id, product_id)
-        await session.commit()
-        return False
-
-
-
 
+    # Иначе удаляем последнюю единицу товара
+    query = (
+        delete(Cart)
+        .where(Cart.user_id == user_id, Cart.product_id == product_id, Cart.quantity <= 1)
+        .execution_options(synchronize_session=False)
+    )
+    result = await session.execute(query)
+    await _commit(session)
+    if not result.rowcount:
+        return
+    return False
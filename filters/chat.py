@@ -1,6 +1,8 @@
 from aiogram.filters import Filter
 from aiogram import Bot, types
 
+from common.admins import admin_registry
+
 
 class ChatTypeFilter(Filter):
     def __init__(self, chat_types: list[str]) -> None:
@@ -15,4 +17,5 @@ class IsAdmin(Filter):
         pass
 
     async def __call__(self, message: types.Message, bot: Bot) -> bool:
-        return message.from_user.id in bot.my_admins_list
\ No newline at end of file
+        # Владелец или админ одной из групп ADMIN_CHAT_IDS (см. common/admins.py)
+        return admin_registry.is_shop_admin(message.from_user.id)
\ No newline at end of file
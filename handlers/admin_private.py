@@ -2,19 +2,28 @@ from aiogram import F, Bot, Router, types
 from aiogram.filters import Command, StateFilter, or_f
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
+from common.media import media_store, photo
 from database.models import Product
 from filters.chat import IsAdmin, ChatTypeFilter
+from handlers.broadcast import start_broadcast
+from handlers.user_group import reload_restricted_words
 from kbds.inline import get_callback_btns
 from kbds.reply import get_keyboard
-from sqlalchemy.ext.asyncio import AsyncSession
+from middlewares.db import discard_changes
+from middlewares.metrics import Instrumentation
+from middlewares.throttling import bulk_sending
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
 from database.orm_query import (
+    orm_add_restricted_word,
     orm_change_banner_image,
+    orm_delete_restricted_word,
+    orm_create_broadcast,
     orm_get_categories,
     orm_add_product,
     orm_delete_product,
     orm_get_info_pages,
     orm_get_product,
-    orm_get_products,
+    orm_get_products_page,
     orm_update_product,
 )
 
@@ -25,6 +34,7 @@ ADMIN_KB = get_keyboard(
     "Добавить авто",
     "Каталог авто",
     "Добавить/Изменить баннер",
+    "Рассылка",
     placeholder="Выберите действие",
     sizes=(2,),
 )
@@ -37,8 +47,9 @@ class AddProduct(StatesGroup):
     price = State()
     image = State()
     status = State()  # Новый шаг для статуса товара
-    
-    product_for_change = None
+
+    # Товар, который редактируется, хранится в данных FSM (product_id и old -
+    # прежние значения для ответа "."), поэтому переживает перезапуск бота
 
     texts = {
         "AddProduct:name": "Введите название товара:",
@@ -53,6 +64,11 @@ class AddProduct(StatesGroup):
 async def admin_features(message: types.Message):
     await message.answer("Что хотите сделать?", reply_markup=ADMIN_KB)
 
+# Сводка метрик хендлеров и БД (см. middlewares/metrics.py)
+@admin_router.message(Command("stats"))
+async def show_stats(message: types.Message, metrics: Instrumentation):
+    await message.answer(metrics.summary())
+
 # Обработчик "Каталог авто" для выбора категории
 @admin_router.message(F.text == "Каталог авто")
 async def catalog_auto(message: types.Message, session: AsyncSession):
@@ -60,36 +76,70 @@ async def catalog_auto(message: types.Message, session: AsyncSession):
     btns = {category.name: f"category_{category.id}" for category in categories}
     await message.answer("Выберите категорию", reply_markup=get_callback_btns(btns=btns))
 
+ADMIN_CATALOG_PAGE = 10  # Больше 10 фото в одном альбоме Telegram не принимает
+
+
 # Обработчик callback для выбора категории и тут пытался 2.
+# Формат: category_<id> или category_<id>_<страница>
 @admin_router.callback_query(F.data.startswith("category_"))
 async def category_auto_products_callback(callback: types.CallbackQuery, session: AsyncSession):
-    category_id = int(callback.data.split("_")[-1])
-    
-
-    
-    # Передаем include_busy=True для администраторов
-    products = await orm_get_products(session, category_id, include_busy=True)
+    parts = callback.data.split("_")
+    category_id = int(parts[1])
+    page = int(parts[2]) if len(parts) > 2 else 1
+
+    # Передаем include_busy=True для администраторов.
+    # Из БД читаем только одну страницу категории.
+    paginator = await orm_get_products_page(
+        session, category_id, page=page, per_page=ADMIN_CATALOG_PAGE, include_busy=True
+    )
 
-    if not products:
+    if not paginator.total:
+        await callback.answer()
         await callback.message.answer("В этой категории пока нет авто.")
-    else:
-        for product in products:
-            await callback.message.answer_photo(
-                product.image,
-                caption=f"<strong>{product.name}</strong>\n"
-                        f"{product.description}\n"
-                        f"Стоимость за час: {round(product.price, 2)}\n"
-                        f"Статус: {product.status}",
-                reply_markup=get_callback_btns(
-                    btns={
-                        "Удалить": f"delete_{product.id}",
-                        "Изменить": f"change_{product.id}",
-                    }
-                ),
-            )
+        return
+
+    first = (paginator.page - 1) * ADMIN_CATALOG_PAGE + 1
+    products = list(enumerate(paginator.get_page(), start=first))
+
+    # Страница каталога - это один альбом и одно сообщение-оглавление с кнопками
+    media = [
+        await photo(
+            product.image,
+            caption=f"<strong>{number}. {product.name}</strong>\n"
+                    f"{product.description}\n"
+                    f"Стоимость за час: {round(product.price, 2)}\n"
+                    f"Статус: {product.status}",
+        )
+        for number, product in products
+    ]
+    with bulk_sending():
+        if len(media) > 1:
+            messages = await callback.message.answer_media_group(media)
+        else:
+            # Альбом из одного фото Telegram не примет
+            messages = [await callback.message.answer_photo(media[0].media, caption=media[0].caption)]
+    for item, message in zip(media, messages):
+        await media_store.remember(session, item.media, message)
+
+    lines = [
+        f"{number}. {product.name} - {round(product.price, 2)} - {product.status}"
+        for number, product in products
+    ]
+    btns = {}
+    for number, product in products:
+        btns[f"✏️ {number}"] = f"change_{product.id}"
+        btns[f"❌ {number}"] = f"delete_{product.id}"
+    if paginator.has_previous():
+        btns["◀ Пред."] = f"category_{category_id}_{paginator.has_previous()}"
+    if paginator.has_next():
+        btns["След. ▶"] = f"category_{category_id}_{paginator.has_next()}"
 
     await callback.answer()
-    await callback.message.answer("ОК, вот список авто ⏫")
+    await callback.message.answer(
+        f"<strong>Страница {paginator.page} из {paginator.pages}</strong> (всего авто: {paginator.total})\n"
+        + "\n".join(lines),
+        reply_markup=get_callback_btns(btns=btns),
+    )
 
 # Обработчик удаления авто
 @admin_router.callback_query(F.data.startswith('delete_'))
@@ -141,7 +191,16 @@ async def change_product_callback(
     product_id = callback.data.split("_")[-1]
     product_for_change = await orm_get_product(session, int(product_id))
 
-    AddProduct.product_for_change = product_for_change
+    # Цена из Numeric - Decimal, в FSM кладем строку
+    await state.update_data(
+        product_id=product_for_change.id,
+        old={
+            "name": product_for_change.name,
+            "description": product_for_change.description,
+            "price": str(product_for_change.price),
+            "image": product_for_change.image,
+        },
+    )
 
     await callback.answer()
     await callback.message.answer(
@@ -152,6 +211,8 @@ async def change_product_callback(
 # Обработчик начала добавления нового товара
 @admin_router.message(F.text == "Добавить авто")
 async def add_product(message: types.Message, state: FSMContext):
+    # Новый товар: данные прошлого редактирования (product_id) не нужны
+    await state.set_data({})
     await message.answer("Введите название товара", reply_markup=types.ReplyKeyboardRemove())
     await state.set_state(AddProduct.name)
 
@@ -162,8 +223,6 @@ async def cancel_handler(message: types.Message, state: FSMContext) -> None:
     current_state = await state.get_state()
     if current_state is None:
         return
-    if AddProduct.product_for_change:
-        AddProduct.product_for_change = None
     await state.clear()
     await message.answer("Действия отменены", reply_markup=ADMIN_KB)
 
@@ -187,11 +246,16 @@ async def back_step_handler(message: types.Message, state: FSMContext) -> None:
             return
         previous = step
 
+async def old_value(state: FSMContext, field: str):
+    # Прежнее значение редактируемого товара для ответа "." (None для нового товара)
+    data = await state.get_data()
+    return data.get("old", {}).get(field)
+
 # Обработчики для ввода данных на каждом шаге
 @admin_router.message(AddProduct.name, or_f(F.text, F.text == '.'))
 async def add_name(message: types.Message, state: FSMContext):
-    if message.text == ".":
-        await state.update_data(name=AddProduct.product_for_change.name)
+    if message.text == "." and await old_value(state, "name") is not None:
+        await state.update_data(name=await old_value(state, "name"))
     else:
         if len(message.text) >= 100:
             await message.answer("Название товара не должно превышать 100 символов.\nВведите заново")
@@ -205,8 +269,8 @@ async def add_name(message: types.Message, state: FSMContext):
 
 @admin_router.message(AddProduct.description, or_f(F.text, F.text == "."))  
 async def add_description(message: types.Message, state: FSMContext, session: AsyncSession):
-    if message.text == ".":
-        await state.update_data(description=AddProduct.product_for_change.description)
+    if message.text == "." and await old_value(state, "description") is not None:
+        await state.update_data(description=await old_value(state, "description"))
     else:
         await state.update_data(description=message.text)
     categories = await orm_get_categories(session)
@@ -234,8 +298,8 @@ async def category_choice2(message: types.Message, state: FSMContext):
 # Ловим данные для состояние price и потом меняем состояние на image
 @admin_router.message(AddProduct.price, F.text)
 async def add_price(message: types.Message, state: FSMContext):
-    if message.text == "." and AddProduct.product_for_change:
-        await state.update_data(price=AddProduct.product_for_change.price)
+    if message.text == "." and await old_value(state, "price") is not None:
+        await state.update_data(price=await old_value(state, "price"))
     else:
         try:
             float(message.text)
@@ -250,7 +314,11 @@ async def add_price(message: types.Message, state: FSMContext):
 @admin_router.message(AddProduct.image, or_f(F.photo, F.text == ".")) 
 async def add_image(message: types.Message, state: FSMContext):
     if message.text and message.text == ".":
-        await state.update_data(image=AddProduct.product_for_change.image)
+        image = await old_value(state, "image")
+        if image is None:
+            await add_image_invalid(message)
+            return
+        await state.update_data(image=image)
     else:
         await state.update_data(image=message.photo[-1].file_id)
 
@@ -268,18 +336,87 @@ async def add_status(message: types.Message, state: FSMContext, session: AsyncSe
     data = await state.get_data()
 
     try:
-        if AddProduct.product_for_change:
-            await orm_update_product(session, AddProduct.product_for_change.id, data)
+        if data.get("product_id"):
+            await orm_update_product(session, data["product_id"], data)
         else:
             await orm_add_product(session, data)
         await message.answer("Товар добавлен/изменен", reply_markup=ADMIN_KB)
     except Exception as e:
+        await discard_changes(session)
         await message.answer(f"Ошибка: {str(e)}\nОшибка изменения авто.", reply_markup=ADMIN_KB)
+        raise
     finally:
         await state.clear()
 
-    AddProduct.product_for_change = None
-
 @admin_router.message(AddProduct.image)
 async def add_image_invalid(message: types.Message):
     await message.answer("Отправьте фото товара или напишите '.' для сохранения старого изображения.")
+
+
+################# Рассылка всем пользователям ############################
+
+class BroadcastState(StatesGroup):
+    message = State()
+
+@admin_router.message(StateFilter(None), Command("broadcast"))
+@admin_router.message(StateFilter(None), F.text == "Рассылка")
+async def broadcast_start(message: types.Message, state: FSMContext):
+    await message.answer(
+        "Отправьте сообщение или фото для рассылки всем пользователям.\nДля отмены напишите \"отмена\"",
+        reply_markup=types.ReplyKeyboardRemove(),
+    )
+    await state.set_state(BroadcastState.message)
+
+# Рассылается копия присланного сообщения, поэтому подходит и текст, и фото с подписью
+@admin_router.message(BroadcastState.message, or_f(F.text, F.photo))
+async def broadcast_message(
+    message: types.Message,
+    state: FSMContext,
+    session: AsyncSession,
+    bot: Bot,
+    session_pool: async_sessionmaker,
+):
+    await message.answer("Рассылка запущена", reply_markup=ADMIN_KB)
+    # Это сообщение будет обновляться по ходу рассылки
+    status_message = await message.answer("Идет рассылка...")
+    broadcast = await orm_create_broadcast(
+        session, message.chat.id, message.message_id, status_message.message_id
+    )
+    # Рассылка читает запись в своей сессии, поэтому коммитим сразу,
+    # даже в режиме одной транзакции на апдейт
+    await session.commit()
+    await state.clear()
+    start_broadcast(bot, session_pool, broadcast.id)
+
+@admin_router.message(BroadcastState.message)
+async def broadcast_message_invalid(message: types.Message):
+    await message.answer("Отправьте текст или фото для рассылки или напишите \"отмена\"")
+
+
+################# Запрещенные слова для групп ############################
+
+# /addword слово, /delword слово - список применяется сразу, без перезапуска
+@admin_router.message(Command("addword", "delword"))
+async def edit_restricted_words(
+    message: types.Message,
+    session: AsyncSession,
+    session_pool: async_sessionmaker,
+):
+    command, _, word = message.text.partition(" ")
+    word = word.strip().lower()
+    if not word:
+        await message.answer("Укажите слово, например: /addword спам")
+        return
+    if command.startswith("/addword"):
+        await orm_add_restricted_word(session, word)
+    else:
+        await orm_delete_restricted_word(session, word)
+    # Перезагрузка читает список в своей сессии
+    await session.commit()
+    count = await reload_restricted_words(session_pool)
+    await message.answer(f"Готово. Запрещенных слов: {count}")
+
+@admin_router.message(Command("reloadwords"))
+async def reload_words(message: types.Message, session_pool: async_sessionmaker):
+    count = await reload_restricted_words(session_pool)
+    await message.answer(f"Список обновлен. Запрещенных слов: {count}")
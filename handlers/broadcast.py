@@ -0,0 +1,126 @@
+import asyncio
+import time
+
+from aiogram import Bot
+from aiogram.exceptions import TelegramAPIError, TelegramForbiddenError
+from sqlalchemy.ext.asyncio import async_sessionmaker
+
+from common.tasks import create_background_task
+from database.orm_query import (
+    orm_get_broadcast,
+    orm_get_running_broadcasts,
+    orm_save_broadcast_progress,
+    orm_stream_user_ids,
+)
+from middlewares.throttling import bulk_sending
+
+
+BROADCAST_WORKERS = 10   # Сколько сообщений отправляется одновременно
+BROADCAST_CHUNK = 200    # Получателей за одну порцию; после каждой порции сохраняем прогресс
+REPORT_INTERVAL = 5      # Как часто (сек) обновлять сообщение с прогрессом
+
+# Запущенные рассылки этого процесса: id -> задача
+running_broadcasts: dict[int, asyncio.Task] = {}
+
+
+async def send_copy(bot: Bot, user_id: int, from_chat_id: int, message_id: int) -> str:
+    try:
+        await bot.copy_message(chat_id=user_id, from_chat_id=from_chat_id, message_id=message_id)
+        return "delivered"
+    except TelegramForbiddenError:
+        # Пользователь заблокировал бота
+        return "blocked"
+    except TelegramAPIError:
+        return "failed"
+
+
+def progress_text(counters: dict, rate: float, done: bool = False) -> str:
+    title = "Рассылка завершена" if done else "Идет рассылка..."
+    return (
+        f"<strong>{title}</strong>\n"
+        f"Доставлено: {counters['delivered']}\n"
+        f"Ошибок: {counters['failed']}\n"
+        f"Заблокировали бота: {counters['blocked']}\n"
+        f"Скорость: {rate:.1f} сообщ./с"
+    )
+
+
+async def report(bot: Bot, broadcast, text: str):
+    if not broadcast.status_message_id:
+        return
+    try:
+        await bot.edit_message_text(
+            text=text, chat_id=broadcast.from_chat_id, message_id=broadcast.status_message_id
+        )
+    except TelegramAPIError:
+        pass
+
+
+async def run_broadcast(bot: Bot, session_pool: async_sessionmaker, broadcast_id: int):
+    async with session_pool() as session:
+        broadcast = await orm_get_broadcast(session, broadcast_id)
+
+    counters = {
+        "delivered": broadcast.delivered,
+        "failed": broadcast.failed,
+        "blocked": broadcast.blocked,
+    }
+    started = time.monotonic()
+    sent = 0
+    last_report = started
+    semaphore = asyncio.Semaphore(BROADCAST_WORKERS)
+
+    async def send(user_id: int) -> str:
+        async with semaphore:
+            return await send_copy(bot, user_id, broadcast.from_chat_id, broadcast.message_id)
+
+    with bulk_sending():
+        # Курсор получателей открыт, пока в другой сессии пишется прогресс.
+        # Для SQLite это требует WAL (включен в профилях database/engine.py).
+        async with session_pool() as reader:
+            async for user_ids in orm_stream_user_ids(
+                reader, after_user_id=broadcast.last_user_id, batch_size=BROADCAST_CHUNK
+            ):
+                for result in await asyncio.gather(*(send(user_id) for user_id in user_ids)):
+                    counters[result] += 1
+                sent += len(user_ids)
+
+                # После перезапуска продолжим с этой точки (порция может уйти повторно
+                # только если процесс упал посреди нее)
+                async with session_pool() as session:
+                    await orm_save_broadcast_progress(
+                        session, broadcast_id, last_user_id=user_ids[-1], **counters
+                    )
+
+                now = time.monotonic()
+                if now - last_report >= REPORT_INTERVAL:
+                    last_report = now
+                    await report(bot, broadcast, progress_text(counters, sent / (now - started)))
+
+        async with session_pool() as session:
+            await orm_save_broadcast_progress(session, broadcast_id, status="done", **counters)
+        elapsed = max(time.monotonic() - started, 0.001)
+        await report(bot, broadcast, progress_text(counters, sent / elapsed, done=True))
+
+
+def start_broadcast(bot: Bot, session_pool: async_sessionmaker, broadcast_id: int):
+    if broadcast_id in running_broadcasts:
+        return
+    task = create_background_task(run_broadcast(bot, session_pool, broadcast_id))
+    running_broadcasts[broadcast_id] = task
+    task.add_done_callback(lambda task: finish_broadcast(broadcast_id, task))
+
+
+def finish_broadcast(broadcast_id: int, task: asyncio.Task):
+    running_broadcasts.pop(broadcast_id, None)
+    if not task.cancelled() and task.exception():
+        print(f"Ошибка рассылки {broadcast_id}: {task.exception()}")
+
+
+async def resume_broadcasts(bot: Bot, session_pool: async_sessionmaker):
+    # Рассылки, прерванные перезапуском, продолжаются с сохраненного места
+    async with session_pool() as session:
+        broadcast_ids = await orm_get_running_broadcasts(session)
+    for broadcast_id in broadcast_ids:
+        start_broadcast(bot, session_pool, broadcast_id)
+    return len(broadcast_ids)
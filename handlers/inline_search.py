@@ -0,0 +1,40 @@
+from aiogram import Router, types
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from database.orm_query import orm_search_products
+
+
+# Поиск авто из любого чата: @имя_бота <запрос>.
+# Inline-режим включается у BotFather командой /setinline.
+inline_router = Router()
+
+SEARCH_PAGE = 20      # Telegram показывает до 50 результатов за ответ
+SEARCH_CACHE_TIME = 60
+
+
+@inline_router.inline_query()
+async def search_products(query: types.InlineQuery, session: AsyncSession):
+    offset = int(query.offset) if query.offset.isdigit() else 0
+    # Берем на одну запись больше, чтобы узнать, есть ли следующая страница
+    products = await orm_search_products(session, query.query, offset=offset, limit=SEARCH_PAGE + 1)
+    has_next = len(products) > SEARCH_PAGE
+    products = products[:SEARCH_PAGE]
+
+    results = [
+        types.InlineQueryResultArticle(
+            id=str(product.id),
+            title=f"{product.name} - {round(product.price, 2)}",
+            description=product.description,
+            input_message_content=types.InputTextMessageContent(
+                message_text=f"<strong>{product.name}</strong>\n"
+                             f"{product.description}\n"
+                             f"Стоимость: {round(product.price, 2)}",
+            ),
+        )
+        for product in products
+    ]
+    await query.answer(
+        results,
+        cache_time=SEARCH_CACHE_TIME,
+        next_offset=str(offset + SEARCH_PAGE) if has_next else "",
+    )
@@ -1,6 +1,6 @@
-from aiogram.types import InputMediaPhoto
 from sqlalchemy.ext.asyncio import AsyncSession
-from database.orm_query import Paginator, orm_add_to_cart, orm_delete_from_cart, orm_get_banner, orm_get_categories, orm_get_products, orm_get_user_carts, orm_reduce_product_in_cart
+from common.media import photo
+from database.orm_query import screens_cache, orm_check_cache_version, Paginator, QueryPage, orm_add_to_cart, orm_delete_from_cart, orm_get_banner, orm_get_cart_summary, orm_get_categories, orm_get_products_page, orm_get_user_cart_item, orm_reduce_product_in_cart
 
 
 from kbds.inline import (
@@ -12,9 +12,14 @@ from kbds.inline import (
 
 #from utils.paginator import Paginator
 
+# Готовые экраны уровней 0-2 (главная, каталог, карточки товаров) одинаковы
+# для всех пользователей: screens_cache из database/orm_query.py. Сбрасывается
+# после коммита orm-функций, меняющих товары и баннеры.
+
+
 async def main_menu(session, level, menu_name):
     banner = await orm_get_banner(session, menu_name)
-    image = InputMediaPhoto(media=banner.image, caption=banner.description)
+    image = await photo(banner.image, caption=banner.description)
 
     kbds = get_user_main_btns(level=level)
 
@@ -22,14 +27,14 @@ async def main_menu(session, level, menu_name):
 
 async def catalog(session, level, menu_name):
     banner = await orm_get_banner(session, menu_name)
-    image = InputMediaPhoto(media=banner.image, caption=banner.description)
+    image = await photo(banner.image, caption=banner.description)
 
     categories = await orm_get_categories(session)
     kbds = get_user_catalog_btns(level=level, categories=categories)
 
     return image, kbds
 
-def pages(paginator: Paginator):
+def pages(paginator: Paginator | QueryPage):
     btns = dict()
     if paginator.has_previous():
         btns["◀ Пред."] = "previous"
@@ -42,13 +47,12 @@ def pages(paginator: Paginator):
 
 
 async def products(session, level, category, page):
-    products = await orm_get_products(session, category_id=category)
-
-    paginator = Paginator(products, page=page)
+    paginator = await orm_get_products_page(session, category_id=category, page=page)
     product = paginator.get_page()[0]
+    page = paginator.page
 
-    image = InputMediaPhoto(
-        media=product.image,
+    image = await photo(
+        product.image,
         caption=f"<strong>{product.name}\
                 </strong>\n{product.description}\nСтоимость: {round(product.price, 2)}\n\
                 <strong>Товар {paginator.page} из {paginator.pages}</strong>",
@@ -78,12 +82,12 @@ async def carts(session, level, menu_name, page, user_id, product_id):
     elif menu_name == "increment":
         await orm_add_to_cart(session, user_id, product_id)
 
-    carts = await orm_get_user_carts(session, user_id)
+    carts_count, total_price = await orm_get_cart_summary(session, user_id)
 
-    if not carts:
+    if not carts_count:
         banner = await orm_get_banner(session, "cart")
-        image = InputMediaPhoto(
-            media=banner.image, caption=f"<strong>{banner.description}</strong>"
+        image = await photo(
+            banner.image, caption=f"<strong>{banner.description}</strong>"
         )
 
         kbds = get_user_cart(
@@ -94,16 +98,14 @@ async def carts(session, level, menu_name, page, user_id, product_id):
         )
 
     else:
-        paginator = Paginator(carts, page=page)
-
-        cart = paginator.get_page()[0]
+        page = max(1, min(page, carts_count))
+        cart = await orm_get_user_cart_item(session, user_id, page)
+        paginator = QueryPage([cart], page, carts_count, carts_count)
 
         cart_price = round(cart.quantity * cart.product.price, 2)
-        total_price = round(
-            sum(cart.quantity * cart.product.price for cart in carts), 2
-        )
-        image = InputMediaPhoto(
-            media=cart.product.image,
+        total_price = round(total_price, 2)
+        image = await photo(
+            cart.product.image,
             caption=f"<strong>{cart.product.name}</strong>\n{cart.product.price}Р. x {cart.quantity} = {cart_price}Р.\
                     \nАвто {paginator.page} из {paginator.pages} в корзине.\nОбщая стоимость авто в корзине {total_price}",
         )
@@ -128,11 +130,23 @@ async def get_menu_content(
     product_id: int | None = None,
     user_id: int | None = None,
 ):
-    if level == 0:
-        return await main_menu(session, level, menu_name)
-    elif level == 1:
-        return await catalog(session, level, menu_name)
-    elif level == 2:
-        return await products(session, level, category, page)
+    if level <= 2:
+        # Правка в админке другого воркера тоже сбрасывает кэш (см. cache_version)
+        await orm_check_cache_version(session)
+        # Карточка товара не зависит от menu_name ("next", "previous" или имя категории)
+        key = (level, None if level == 2 else menu_name, category, page)
+        content = screens_cache.get(key)
+        if content is None:
+            if level == 0:
+                content = await main_menu(session, level, menu_name)
+            elif level == 1:
+                content = await catalog(session, level, menu_name)
+            else:
+                content = await products(session, level, category, page)
+            # Экран с еще не загруженной картинкой не кэшируем: после первой
+            # отправки у нее появится file_id
+            if isinstance(content[0].media, str):
+                screens_cache.set(key, content)
+        return content
     elif level == 3:
         return await carts(session, level, menu_name, page, user_id, product_id)
\ No newline at end of file
@@ -1,44 +1,141 @@
-from string import punctuation
+import asyncio
 
 from aiogram import F, Bot, types, Router
 from aiogram.filters import Command
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
 
 
 from filters.chat import ChatTypeFilter
+from common.admins import admin_registry
 from common.words import restricted_words
+from common.word_filter import WordMatcher
+from common.tasks import create_background_task
+from database.orm_query import (
+    orm_add_chat_admin,
+    orm_delete_chat_admin,
+    orm_get_chat_admins,
+    orm_get_restricted_words,
+    orm_set_chat_admins,
+)
 
 
 user_group_router = Router()
 user_group_router.message.filter(ChatTypeFilter(["group", "supergroup"]))
 user_group_router.edited_message.filter(ChatTypeFilter(["group", "supergroup"]))
+user_group_router.chat_member.filter(ChatTypeFilter(["group", "supergroup"]))
+user_group_router.my_chat_member.filter(ChatTypeFilter(["group", "supergroup"]))
 
+ADMIN_STATUSES = ("creator", "administrator")
 
-@user_group_router.message(Command("admin"))
-async def get_admins(message: types.Message, bot: Bot):
-    chat_id = message.chat.id
+# Ссылки на фоновые обновления списков админов
+refresh_tasks = set()
+
+
+async def refresh_chat_admins(bot: Bot, session_pool: async_sessionmaker, chat_id: int):
+    # Повторные запросы того же чата, пока идет этот, не нужны
+    admin_registry.mark_refreshed(chat_id)
     admins_list = await bot.get_chat_administrators(chat_id)
-    #просмотреть все данные и свойства полученных объектов
-    #print(admins_list)
-    # Код ниже это генератор списка, как и этот x = [i for i in range(10)]
-    admins_list = [
+    admins_list = {
         member.user.id
         for member in admins_list
-        if member.status == "creator" or member.status == "administrator"
-    ]
-    bot.my_admins_list = admins_list
+        if member.status in ADMIN_STATUSES
+    }
+    admin_registry.set_chat(chat_id, admins_list)
+    async with session_pool() as session:
+        await orm_set_chat_admins(session, chat_id, admins_list)
+    return admins_list
+
+
+async def safe_refresh_chat_admins(bot: Bot, session_pool: async_sessionmaker, chat_id: int):
+    try:
+        await refresh_chat_admins(bot, session_pool, chat_id)
+    except Exception as e:
+        print(f"Ошибка обновления админов чата {chat_id}: {e}")
+
+
+async def reload_chat_admins(session_pool: async_sessionmaker):
+    async with session_pool() as session:
+        rows = await orm_get_chat_admins(session)
+    return admin_registry.load(rows)
+
+
+@user_group_router.message.middleware()
+async def refresh_stale_admins(handler, message: types.Message, data: dict):
+    # Устаревший список админов обновляем в фоне, не задерживая обработку сообщения
+    if admin_registry.is_stale(message.chat.id):
+        admin_registry.mark_refreshed(message.chat.id)
+        task = create_background_task(
+            safe_refresh_chat_admins(data["bot"], data["session_pool"], message.chat.id)
+        )
+        refresh_tasks.add(task)
+        task.add_done_callback(refresh_tasks.discard)
+    return await handler(message, data)
+
+
+@user_group_router.message(Command("admin"))
+async def get_admins(message: types.Message, bot: Bot, session_pool: async_sessionmaker):
+    admins_list = await refresh_chat_admins(bot, session_pool, message.chat.id)
     if message.from_user.id in admins_list:
         await message.delete()
-    #print(admins_list)
 
 
-def clean_text(text: str):
-    return text.translate(str.maketrans("", "", punctuation))
+@user_group_router.chat_member()
+async def track_admins(event: types.ChatMemberUpdated, session: AsyncSession):
+    # Назначение и снятие админов приходит апдейтами chat_member
+    # (Telegram присылает их, только если бот сам админ в группе)
+    chat_id = event.chat.id
+    user_id = event.new_chat_member.user.id
+    if event.new_chat_member.status in ADMIN_STATUSES:
+        admin_registry.add(chat_id, user_id)
+        await orm_add_chat_admin(session, chat_id, user_id)
+    elif event.old_chat_member.status in ADMIN_STATUSES:
+        admin_registry.remove(chat_id, user_id)
+        await orm_delete_chat_admin(session, chat_id, user_id)
+
+
+@user_group_router.my_chat_member()
+async def track_bot_membership(event: types.ChatMemberUpdated, session: AsyncSession):
+    chat_id = event.chat.id
+    if event.new_chat_member.status in ("left", "kicked"):
+        # Бота удалили из группы - ее админы больше не нужны
+        admin_registry.drop_chat(chat_id)
+        await orm_delete_chat_admin(session, chat_id)
+    else:
+        # Права бота изменились - список запросим заново при следующем сообщении
+        admin_registry.refreshed.pop(chat_id, None)
+
+
+# Автомат запрещенных слов. До первой загрузки из БД - список из common/words.py
+word_matcher = WordMatcher(restricted_words)
+
+
+async def reload_restricted_words(session_pool: async_sessionmaker):
+    async with session_pool() as session:
+        words = await orm_get_restricted_words(session)
+    word_matcher.load(words)
+    return word_matcher.size
+
+
+async def group_data_refresher(session_pool: async_sessionmaker, interval: float = 60):
+    # Подхватываем изменения запрещенных слов и админов без перезапуска
+    # (в том числе сделанные другими процессами)
+    while True:
+        try:
+            await reload_restricted_words(session_pool)
+            await reload_chat_admins(session_pool)
+        except Exception as e:
+            print(f"Ошибка загрузки данных групп: {e}")
+        await asyncio.sleep(interval)
 
 
 @user_group_router.edited_message()
 @user_group_router.message()
 async def cleaner(message: types.Message):
-    if restricted_words.intersection(clean_text(message.text.lower()).split()):
+    # У фото и видео текст лежит в подписи, у стикеров его нет вовсе
+    text = message.text or message.caption
+    if not text:
+        return
+    if word_matcher.find(text):
         await message.answer(
             f"{message.from_user.first_name}, соблюддайте порядок в чате!"
         )
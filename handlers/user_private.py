@@ -1,19 +1,25 @@
 from aiogram import F, Router, types
+from aiogram.exceptions import TelegramBadRequest
 from aiogram.filters import CommandStart
 from aiogram.types import ReplyKeyboardMarkup, KeyboardButton, ReplyKeyboardRemove
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
 from sqlalchemy.ext.asyncio import AsyncSession
+from common.media import media_store
 from handlers.menu_processing import get_menu_content
 from kbds.inline import MenuCallBack, get_callback_btns
+from middlewares.db import discard_changes
 from database.orm_query import (
     orm_add_to_cart,
     orm_add_user,
+    orm_ensure_user,
+    registered_users,
 )
 
 # Инициализация роутера
 user_private_router = Router()
-registered_users = set()  # Локальный список зарегистрированных пользователей
+# registered_users - множество зарегистрированных пользователей из database.orm_query.
+# Прогревается из таблицы User при старте и пополняется в orm_add_user после коммита.
 
 # Состояния регистрации
 class RegistrationState(StatesGroup):
@@ -45,11 +51,12 @@ async def start_cmd(message: types.Message, state: FSMContext, session: AsyncSes
         # Если пользователь зарегистрирован, показываем меню
         media, reply_markup = await get_menu_content(session, level=0, menu_name="main")
         if media:
-            await message.answer_photo(
+            sent = await message.answer_photo(
                 media.media,
                 caption=media.caption,
                 reply_markup=reply_markup
             )
+            await media_store.remember(session, media.media, sent)
         else:
             await message.answer("Извините, меню недоступно.")
 
@@ -97,8 +104,7 @@ async def process_phone(message: types.Message, state: FSMContext, session: Asyn
                 phone=phone_number
             )
 
-            # Добавление пользователя в локальный список зарегистрированных
-            registered_users.add(user_id)
+            # orm_add_user сам добавляет пользователя в registered_users
             await message.answer(
                 f"Регистрация завершена!\nИмя: {user_name}\nФамилия: {user_last_name}\nТелефон: {phone_number}",
                 reply_markup=ReplyKeyboardRemove()
@@ -108,18 +114,22 @@ async def process_phone(message: types.Message, state: FSMContext, session: Asyn
             # Показ меню после завершения регистрации
             media, reply_markup = await get_menu_content(session, level=0, menu_name="main")
             if media:
-                await message.answer_photo(
+                sent = await message.answer_photo(
                     media.media,
                     caption=media.caption,
                     reply_markup=reply_markup
                 )
+                await media_store.remember(session, media.media, sent)
             else:
                 await message.answer("Извините, меню недоступно.")
         else:
             await message.answer("Пожалуйста, отправьте ваш номер телефона с помощью кнопки.")
-    except Exception as e:
+    except Exception:
+        # Откат до ответа пользователю, затем ошибка уходит дальше:
+        # в лог aiogram и в счетчик ошибок метрик
+        await discard_changes(session)
         await message.answer("Произошла ошибка при регистрации. Попробуйте еще раз.")
-        print(f"Ошибка: {e}")
+        raise
 
 # Проверка регистрации
 async def ensure_registered(message: types.Message) -> bool:
@@ -135,27 +145,24 @@ async def ensure_registered(message: types.Message) -> bool:
 async def add_to_cart(callback: types.CallbackQuery, callback_data: MenuCallBack, session: AsyncSession):
     try:
         user = callback.from_user
-        await orm_add_user(
-            session,
-            user_id=user.id,
-            first_name=user.first_name,
-            last_name=user.last_name,
-            phone=None,
-        )
+        # Только гарантируем строку пользователя: имена из Telegram не должны
+        # затирать введенные при регистрации. Известных пользователей не проверяем в БД.
+        await orm_ensure_user(session, user.id)
         await orm_add_to_cart(session, user_id=user.id, product_id=callback_data.product_id)
         await callback.answer("Товар добавлен в корзину.")
-    except Exception as e:
+    except Exception:
+        await discard_changes(session)
         await callback.answer("Не удалось добавить товар в корзину.")
-        print(f"Ошибка: {e}")
+        raise
 
 # Обработчик действий в меню
 @user_private_router.callback_query(MenuCallBack.filter())
 async def user_menu(callback: types.CallbackQuery, callback_data: MenuCallBack, session: AsyncSession):
-    try:
-        if callback_data.menu_name == "add_to_cart":
-            await add_to_cart(callback, callback_data, session)
-            return
+    if callback_data.menu_name == "add_to_cart":
+        await add_to_cart(callback, callback_data, session)
+        return
 
+    try:
         media, reply_markup = await get_menu_content(
             session,
             level=callback_data.level,
@@ -166,8 +173,16 @@ async def user_menu(callback: types.CallbackQuery, callback_data: MenuCallBack,
             user_id=callback.from_user.id,
         )
 
-        await callback.message.edit_media(media=media, reply_markup=reply_markup)
+        try:
+            message = await callback.message.edit_media(media=media, reply_markup=reply_markup)
+        except TelegramBadRequest as e:
+            # Повторное нажатие той же кнопки: экран уже показан, это не ошибка
+            if "message is not modified" not in e.message:
+                raise
+            message = None
+        await media_store.remember(session, media.media, message)
         await callback.answer()
-    except Exception as e:
+    except Exception:
+        await discard_changes(session)
         await callback.answer("Произошла ошибка при обработке меню.")
-        print(f"Ошибка: {e}")
+        raise
@@ -0,0 +1,99 @@
+# Компактный формат callback_data меню: m:<уровень>:<код>:<категория>:<страница>:<товар>
+# Числа в base-36, имена меню - однобуквенные коды, пустые поля в конце отбрасываются.
+# Например, прежний "menu:2:next:1:3:" теперь "m:2:n:1:3".
+
+MAX_CALLBACK_LENGTH = 64
+PREFIX = "m"
+SEPARATOR = ":"
+
+MENU_CODES = {
+    "main": "m",
+    "catalog": "c",
+    "cart": "k",
+    "about": "a",
+    "payment": "p",
+    "add_to_cart": "b",
+    "next": "n",
+    "previous": "v",
+    "delete": "x",
+    "decrement": "-",
+    "increment": "+",
+    "order": "o",
+}
+MENU_NAMES = {code: name for name, code in MENU_CODES.items()}
+
+# Кнопки категорий в каталоге передают имя категории как menu_name.
+# В callback_data остается только id (код "@"), имя берется из этой таблицы.
+CATEGORY_CODE = "@"
+# Имя, которого нет в таблице кодов, передается как есть после "~"
+LITERAL_CODE = "~"
+category_names: dict[int, str] = {}
+
+DIGITS = "0123456789abcdefghijklmnopqrstuvwxyz"
+
+
+def to_base36(number: int) -> str:
+    if number < 0:
+        return "-" + to_base36(-number)
+    if number < 36:
+        return DIGITS[number]
+    digits = []
+    while number:
+        number, rest = divmod(number, 36)
+        digits.append(DIGITS[rest])
+    return "".join(reversed(digits))
+
+
+def pack_menu(
+    level: int,
+    menu_name: str,
+    category: int | None = None,
+    page: int = 1,
+    product_id: int | None = None,
+) -> str:
+    code = MENU_CODES.get(menu_name)
+    if code is None:
+        if category is not None:
+            category_names[category] = menu_name
+            code = CATEGORY_CODE
+        else:
+            code = LITERAL_CODE + menu_name
+    parts = [
+        PREFIX,
+        to_base36(level),
+        code,
+        "" if category is None else to_base36(category),
+        "" if page == 1 else to_base36(page),
+        "" if product_id is None else to_base36(product_id),
+    ]
+    while not parts[-1]:
+        parts.pop()
+    value = SEPARATOR.join(parts)
+    if SEPARATOR in code or len(value.encode()) > MAX_CALLBACK_LENGTH:
+        raise ValueError(f"Нельзя упаковать в callback_data: {menu_name!r}")
+    return value
+
+
+def unpack_menu(value: str) -> dict:
+    # Разбор за постоянное время: один split и поиск кодов в словарях
+    prefix, level, code, *rest = value.split(SEPARATOR)
+    if prefix != PREFIX or len(rest) > 3:
+        raise ValueError(f"Не callback_data меню: {value!r}")
+    category, page, product_id = (rest + ["", "", ""])[:3]
+    category = int(category, 36) if category else None
+
+    if code == CATEGORY_CODE:
+        # После перезапуска имени может еще не быть - на экран товаров оно не влияет
+        menu_name = category_names.get(category, "catalog")
+    elif code.startswith(LITERAL_CODE):
+        menu_name = code[1:]
+    else:
+        menu_name = MENU_NAMES[code]
+
+    return {
+        "level": int(level, 36),
+        "menu_name": menu_name,
+        "category": category,
+        "page": int(page, 36) if page else 1,
+        "product_id": int(product_id, 36) if product_id else None,
+    }
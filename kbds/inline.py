@@ -1,18 +1,76 @@
+import sys
+from functools import lru_cache
+
 from aiogram.types import InlineKeyboardButton
 from aiogram.utils.keyboard import InlineKeyboardBuilder
 from aiogram.filters.callback_data import CallbackData
 
+from kbds.callback_codec import pack_menu, unpack_menu
+
 
 
 class MenuCallBack(CallbackData, prefix="menu"):
+    # Упаковка в компактный формат kbds/callback_codec.py.
+    # Старый формат "menu:..." по-прежнему читается - для уже отправленных сообщений.
     level: int
     menu_name: str
     category: int | None = None
     page: int = 1
     product_id: int | None = None
 
+    def pack(self) -> str:
+        return pack_menu(self.level, self.menu_name, self.category, self.page, self.product_id)
+
+    @classmethod
+    def unpack(cls, value: str) -> "MenuCallBack":
+        if value.startswith(cls.__prefix__ + cls.__separator__):
+            return super().unpack(value)
+        try:
+            fields = unpack_menu(value)
+        except (KeyError, IndexError) as e:
+            raise ValueError(f"Bad callback data {value!r}") from e
+        return cls(**fields)
+
+
+# Клавиатуры меню одинаковы у всех пользователей и зависят только от уровня,
+# страницы и id товара. Поэтому собираются один раз и дальше берутся из LRU-кэша.
+# Возвращаемые объекты общие - изменять их после получения нельзя.
+KEYBOARDS_CACHE_SIZE = 4096
+
+
+@lru_cache(maxsize=KEYBOARDS_CACHE_SIZE)
+def menu_callback(
+    level: int,
+    menu_name: str,
+    category: int | None = None,
+    page: int = 1,
+    product_id: int | None = None,
+) -> str:
+    # Одинаковые callback_data - один и тот же объект строки
+    return sys.intern(pack_menu(level, menu_name, category, page, product_id))
+
+
+@lru_cache(maxsize=KEYBOARDS_CACHE_SIZE)
+def menu_button(text: str, level: int, menu_name: str, **params) -> InlineKeyboardButton:
+    return InlineKeyboardButton(text=text, callback_data=menu_callback(level, menu_name, **params))
+
+
+def pagination_row(level: int, page: int, pagination_btns: tuple, **params) -> list:
+    row = []
+    for text, menu_name in pagination_btns:
+        if menu_name == "next":
+            row.append(menu_button(text, level, menu_name, page=page + 1, **params))
+        elif menu_name == "previous":
+            row.append(menu_button(text, level, menu_name, page=page - 1, **params))
+    return row
+
 
 def get_user_main_btns(*, level: int, sizes: tuple[int] = (2,)):
+    return _user_main_btns(level, sizes)
+
+
+@lru_cache(maxsize=16)
+def _user_main_btns(level: int, sizes: tuple[int]):
     keyboard = InlineKeyboardBuilder()
     btns = {
         "Каталог": "catalog",
@@ -22,29 +80,29 @@ def get_user_main_btns(*, level: int, sizes: tuple[int] = (2,)):
     }
     for text, menu_name in btns.items():
         if menu_name == 'catalog':
-            keyboard.add(InlineKeyboardButton(text=text,
-                    callback_data=MenuCallBack(level=level+1, menu_name=menu_name).pack()))
+            keyboard.add(menu_button(text, level + 1, menu_name))
         elif menu_name == 'cart':
-            keyboard.add(InlineKeyboardButton(text=text,
-                    callback_data=MenuCallBack(level=3, menu_name=menu_name).pack()))
+            keyboard.add(menu_button(text, 3, menu_name))
         else:
-            keyboard.add(InlineKeyboardButton(text=text,
-                    callback_data=MenuCallBack(level=level, menu_name=menu_name).pack()))
-            
+            keyboard.add(menu_button(text, level, menu_name))
+
     return keyboard.adjust(*sizes).as_markup()
 
 
 def get_user_catalog_btns(*, level: int, categories: list, sizes: tuple[int] = (2,)):
+    # Ключ кэша - сами категории, поэтому после их изменения клавиатура соберется заново
+    return _user_catalog_btns(level, tuple((c.id, c.name) for c in categories), sizes)
+
+
+@lru_cache(maxsize=64)
+def _user_catalog_btns(level: int, categories: tuple, sizes: tuple[int]):
     keyboard = InlineKeyboardBuilder()
 
-    keyboard.add(InlineKeyboardButton(text='Назад',
-                callback_data=MenuCallBack(level=level-1, menu_name='main').pack()))
-    keyboard.add(InlineKeyboardButton(text='Корзина 🛒',
-                callback_data=MenuCallBack(level=3, menu_name='cart').pack()))
-    
-    for c in categories:
-        keyboard.add(InlineKeyboardButton(text=c.name,
-                callback_data=MenuCallBack(level=level+1, menu_name=c.name, category=c.id).pack()))
+    keyboard.add(menu_button('Назад', level - 1, 'main'))
+    keyboard.add(menu_button('Корзина 🛒', 3, 'cart'))
+
+    for category_id, name in categories:
+        keyboard.add(menu_button(name, level + 1, name, category=category_id))
 
     return keyboard.adjust(*sizes).as_markup()
 
@@ -57,34 +115,20 @@ def get_products_btns(
     product_id: int,
     sizes: tuple[int] = (2, 1)
 ):
+    return _products_btns(level, category, page, tuple(pagination_btns.items()), product_id, sizes)
+
+
+@lru_cache(maxsize=KEYBOARDS_CACHE_SIZE)
+def _products_btns(level, category, page, pagination_btns, product_id, sizes):
     keyboard = InlineKeyboardBuilder()
 
-    keyboard.add(InlineKeyboardButton(text='Назад',
-                callback_data=MenuCallBack(level=level-1, menu_name='catalog').pack()))
-    keyboard.add(InlineKeyboardButton(text='Корзина 🛒',
-                callback_data=MenuCallBack(level=3, menu_name='cart').pack()))
-    keyboard.add(InlineKeyboardButton(text='Арендовать 💵',
-                callback_data=MenuCallBack(level=level, menu_name='add_to_cart', product_id=product_id).pack()))
+    keyboard.add(menu_button('Назад', level - 1, 'catalog'))
+    keyboard.add(menu_button('Корзина 🛒', 3, 'cart'))
+    keyboard.add(menu_button('Арендовать 💵', level, 'add_to_cart', product_id=product_id))
 
     keyboard.adjust(*sizes)
 
-    row = []
-    for text, menu_name in pagination_btns.items():
-        if menu_name == "next":
-            row.append(InlineKeyboardButton(text=text,
-                    callback_data=MenuCallBack(
-                        level=level,
-                        menu_name=menu_name,
-                        category=category,
-                        page=page + 1).pack()))
-        
-        elif menu_name == "previous":
-            row.append(InlineKeyboardButton(text=text,
-                    callback_data=MenuCallBack(
-                        level=level,
-                        menu_name=menu_name,
-                        category=category,
-                        page=page - 1).pack()))
+    row = pagination_row(level, page, pagination_btns, category=category)
 
     return keyboard.row(*row).as_markup()
 
@@ -96,41 +140,54 @@ def get_user_cart(
     product_id: int | None,
     sizes: tuple[int] = (3,)
 ):
-    keyboard = InlineKeyboardBuilder()
     if page:
-        keyboard.add(InlineKeyboardButton(text='Удалить',
-                    callback_data=MenuCallBack(level=level, menu_name='delete', product_id=product_id, page=page).pack()))
-        keyboard.add(InlineKeyboardButton(text='Убавить час',
-                    callback_data=MenuCallBack(level=level, menu_name='decrement', product_id=product_id, page=page).pack()))
-        keyboard.add(InlineKeyboardButton(text='Добавить час',
-                    callback_data=MenuCallBack(level=level, menu_name='increment', product_id=product_id, page=page).pack()))
-
-        keyboard.adjust(*sizes)
-
-        row = []
-        for text, menu_name in pagination_btns.items():
-            if menu_name == "next":
-                row.append(InlineKeyboardButton(text=text,
-                        callback_data=MenuCallBack(level=level, menu_name=menu_name, page=page + 1).pack()))
-            elif menu_name == "previous":
-                row.append(InlineKeyboardButton(text=text,
-                        callback_data=MenuCallBack(level=level, menu_name=menu_name, page=page - 1).pack()))
-
-        keyboard.row(*row)
-
-        row2 = [
-        InlineKeyboardButton(text='На главную 🏠',
-                    callback_data=MenuCallBack(level=0, menu_name='main').pack()),
-        #InlineKeyboardButton(text='Заказать',
-                    #callback_data=MenuCallBack(level=0, menu_name='order').pack()),
-        ]
-        return keyboard.row(*row2).as_markup()
-    else:
-        keyboard.add(
-            InlineKeyboardButton(text='На главную 🏠',
-                    callback_data=MenuCallBack(level=0, menu_name='main').pack()))
-        
-        return keyboard.adjust(*sizes).as_markup()
+        return _user_cart_btns(level, page, tuple(pagination_btns.items()), product_id, sizes)
+    return _empty_cart_btns(sizes)
+
+
+@lru_cache(maxsize=KEYBOARDS_CACHE_SIZE)
+def _user_cart_btns(level, page, pagination_btns, product_id, sizes):
+    keyboard = InlineKeyboardBuilder()
+    keyboard.add(menu_button('Удалить', level, 'delete', product_id=product_id, page=page))
+    keyboard.add(menu_button('Убавить час', level, 'decrement', product_id=product_id, page=page))
+    keyboard.add(menu_button('Добавить час', level, 'increment', product_id=product_id, page=page))
+
+    keyboard.adjust(*sizes)
+
+    keyboard.row(*pagination_row(level, page, pagination_btns))
+
+    row2 = [
+    menu_button('На главную 🏠', 0, 'main'),
+    #InlineKeyboardButton(text='Заказать',
+                #callback_data=MenuCallBack(level=0, menu_name='order').pack()),
+    ]
+    return keyboard.row(*row2).as_markup()
+
+
+@lru_cache(maxsize=4)
+def _empty_cart_btns(sizes):
+    keyboard = InlineKeyboardBuilder()
+    keyboard.add(menu_button('На главную 🏠', 0, 'main'))
+
+    return keyboard.adjust(*sizes).as_markup()
+
+
+def keyboards_cache_info() -> dict:
+    return {
+        name: function.cache_info()._asdict()
+        for name, function in (
+            ("callbacks", menu_callback),
+            ("buttons", menu_button),
+            ("products", _products_btns),
+            ("cart", _user_cart_btns),
+            ("catalog", _user_catalog_btns),
+        )
+    }
+
+
+# Постоянные клавиатуры собираем сразу при импорте
+get_user_main_btns(level=0)
+get_user_cart(level=3, page=None, pagination_btns=None, product_id=None)
 
 
 
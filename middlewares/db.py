@@ -1,14 +1,94 @@
+import asyncio
+from contextvars import ContextVar
 from typing import Any, Awaitable, Callable, Dict
 
-from aiogram import BaseMiddleware
+from aiogram import BaseMiddleware, Bot
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware, NextRequestMiddlewareType
+from aiogram.methods import TelegramMethod
 from aiogram.types import Message, TelegramObject
 
-from sqlalchemy.ext.asyncio import async_sessionmaker
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+
+# Сессия апдейта в режиме "единица работы" - ее коммитит CommitBeforeRequest
+current_session: ContextVar["LazySession | None"] = ContextVar("current_session", default=None)
+
+
+class LazySession:
+    # Прокси AsyncSession: сессия создается только при первом обращении.
+    # Апдейты, которым БД не нужна (чистка группы, шаги FSM), обходятся без нее.
+    def __init__(self, session_pool: async_sessionmaker, unit_of_work: bool = False):
+        self._session_pool = session_pool
+        self._unit_of_work = unit_of_work
+        self._session = None
+        # Задача апдейта: фоновые задачи, запущенные из хендлера, сессию не коммитят
+        self._task = asyncio.current_task()
+
+    @property
+    def touched(self) -> bool:
+        return self._session is not None
+
+    def __getattr__(self, name):
+        if self._session is None:
+            self._session = self._session_pool(info={"unit_of_work": self._unit_of_work})
+        return getattr(self._session, name)
+
+    async def finish(self):
+        # Коммит в режиме "единица работы": перед запросами к Bot API и в конце апдейта
+        session = self._session
+        if session is None or not session.in_transaction():
+            return
+        await session.commit()
+        for callback in session.info.pop("after_commit", []):
+            callback()
+
+    async def abort(self):
+        if self._session is not None:
+            self._session.info.pop("after_commit", None)
+            await self._session.rollback()
+
+    async def close(self):
+        if self._session is not None:
+            await self._session.close()
+
+
+async def discard_changes(session: AsyncSession):
+    # Для хендлеров, которые сами перехватывают ошибку: откатить изменения апдейта
+    # до ответа пользователю. Иначе этот ответ (через CommitBeforeRequest)
+    # закоммитил бы незавершенную работу. Работает и с обычной AsyncSession.
+    if isinstance(session, LazySession):
+        await session.abort()
+    else:
+        await session.rollback()
+
+
+class CommitBeforeRequest(BaseRequestMiddleware):
+    # Запросы к Bot API идут сотни миллисекунд (плюс очередь лимитера),
+    # и держать все это время открытую транзакцию - значит держать блокировку
+    # записи SQLite. Поэтому перед каждым запросом коммитим сделанное в апдейте;
+    # следующие изменения хендлера попадут в новую транзакцию.
+    async def __call__(
+        self,
+        make_request: NextRequestMiddlewareType,
+        bot: Bot,
+        method: TelegramMethod,
+    ):
+        session = current_session.get()
+        if session is not None and session._task is asyncio.current_task():
+            await session.finish()
+        return await make_request(bot, method)
 
 
 class DataBaseSession(BaseMiddleware):
-    def __init__(self, session_pool: async_sessionmaker):
+    # transactional=True - middleware сам открывает и коммитит транзакцию,
+    # а функции из orm_query только делают flush. Коммит - в конце апдейта
+    # и перед каждым запросом к Bot API (нужен CommitBeforeRequest в сессии бота).
+    def __init__(self, session_pool: async_sessionmaker, transactional: bool = False):
         self.session_pool = session_pool
+        self.transactional = transactional
+        # Сколько апдейтов прошло и скольким из них понадобилась БД
+        self.updates = 0
+        self.updates_with_db = 0
 
 
     async def __call__(
@@ -17,9 +97,25 @@ class DataBaseSession(BaseMiddleware):
         event: TelegramObject,
         data: Dict[str, Any],
     ) -> Any:
-        async with self.session_pool() as session:
-            data['session'] = session
-            return await handler(event, data)
+        session = LazySession(self.session_pool, unit_of_work=self.transactional)
+        data['session'] = session
+        token = current_session.set(session if self.transactional else None)
+        try:
+            result = await handler(event, data)
+            if self.transactional:
+                await session.finish()
+            return result
+        except Exception:
+            if self.transactional:
+                await session.abort()
+            raise
+        finally:
+            current_session.reset(token)
+            self.updates += 1
+            data['db_touched'] = session.touched
+            if session.touched:
+                self.updates_with_db += 1
+            await session.close()
 
 
 
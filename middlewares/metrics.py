@@ -0,0 +1,223 @@
+import bisect
+import time
+from contextvars import ContextVar
+from typing import Any, Awaitable, Callable, Dict
+
+from aiogram import BaseMiddleware, Dispatcher
+from aiogram.types import TelegramObject
+from aiohttp import web
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+
+# Границы корзин гистограммы времени обработки апдейта, секунды
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class UpdateStats:
+    # Замеры одного апдейта: кто его обработал и сколько SQL он выполнил
+    __slots__ = ("router", "handler", "statements", "db_time", "started", "finished")
+
+    def __init__(self):
+        self.router = "dispatcher"
+        self.handler = "unhandled"
+        self.statements = 0
+        self.db_time = 0.0
+        self.started = {}
+        # Апдейт обработан: задачи, унаследовавшие его контекст, сюда больше не пишут
+        self.finished = False
+
+
+current_update: ContextVar[UpdateStats | None] = ContextVar("current_update", default=None)
+
+
+def active_update() -> UpdateStats | None:
+    stats = current_update.get()
+    if stats is None or stats.finished:
+        return None
+    return stats
+
+
+def insert_before_fsm(dp: Dispatcher, middleware):
+    # Внешние middleware апдейтов выполняются в порядке регистрации, а
+    # FSMContextMiddleware Dispatcher регистрирует сам при создании. Чтобы чтение
+    # состояния FSM попадало в замеры, ставим middleware перед ним.
+    manager = dp.update.outer_middleware
+    registered = list(manager[:])
+    index = registered.index(dp.fsm) if dp.fsm in registered else len(registered)
+    for item in registered[index:]:
+        manager.unregister(item)
+    manager.register(middleware)
+    for item in registered[index:]:
+        manager.register(item)
+
+
+class HandlerMetrics:
+    def __init__(self):
+        self.updates = 0
+        self.errors = 0
+        self.statements = 0
+        self.db_time = 0.0
+        self.latency_sum = 0.0
+        # Последняя корзина - все, что больше LATENCY_BUCKETS[-1] (+Inf)
+        self.buckets = [0] * (len(LATENCY_BUCKETS) + 1)
+
+    def observe(self, latency: float, stats: UpdateStats, failed: bool):
+        self.updates += 1
+        self.errors += failed
+        self.statements += stats.statements
+        self.db_time += stats.db_time
+        self.latency_sum += latency
+        self.buckets[bisect.bisect_left(LATENCY_BUCKETS, latency)] += 1
+
+    def quantile(self, q: float) -> float:
+        # Оценка по гистограмме: верхняя граница корзины, в которую попал квантиль
+        rank = q * self.updates
+        seen = 0
+        for bound, count in zip(LATENCY_BUCKETS, self.buckets):
+            seen += count
+            if seen >= rank:
+                return bound
+        return float("inf")
+
+
+class Instrumentation(BaseMiddleware):
+    # Метрики по роутерам и хендлерам: число апдейтов и ошибок, гистограмма
+    # времени обработки, число SQL-запросов и время в БД (события движка SQLAlchemy).
+    # Подключается через setup(dp); отдается в формате Prometheus и командой /stats.
+    def __init__(self, engine: AsyncEngine | None = None):
+        self.handlers: dict[tuple[str, str], HandlerMetrics] = {}
+        # Дополнительные показатели: имя -> функция, возвращающая словарь чисел
+        self.collectors: dict[str, Callable[[], dict]] = {}
+        self.started = time.time()
+        if engine is not None:
+            self.watch_engine(engine)
+
+    def watch_engine(self, engine: AsyncEngine):
+        @event.listens_for(engine.sync_engine, "before_cursor_execute")
+        def before_execute(conn, cursor, statement, parameters, context, executemany):
+            stats = active_update()
+            if stats is not None:
+                stats.started[id(cursor)] = time.perf_counter()
+
+        @event.listens_for(engine.sync_engine, "after_cursor_execute")
+        def after_execute(conn, cursor, statement, parameters, context, executemany):
+            stats = active_update()
+            if stats is not None:
+                started = stats.started.pop(id(cursor), None)
+                stats.statements += 1
+                if started is not None:
+                    stats.db_time += time.perf_counter() - started
+
+    def add_collector(self, name: str, collector: Callable[[], dict]):
+        self.collectors[name] = collector
+
+    def setup(self, dp: Dispatcher):
+        # Внешний слой вокруг всего апдейта (включая FSM и коммит в DataBaseSession)
+        insert_before_fsm(dp, self)
+        # Внутренний слой на каждом событии каждого роутера узнает, какой хендлер сработал
+        for router in dp.chain_tail:
+            for name, observer in router.observers.items():
+                if name not in ("update", "error"):
+                    observer.middleware(self.label_handler)
+
+    async def label_handler(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any],
+    ) -> Any:
+        stats = active_update()
+        if stats is not None:
+            callback = data["handler"].callback
+            stats.router = callback.__module__.rsplit(".", 1)[-1]
+            stats.handler = callback.__name__
+        return await handler(event, data)
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any],
+    ) -> Any:
+        stats = UpdateStats()
+        token = current_update.set(stats)
+        started = time.perf_counter()
+        failed = False
+        try:
+            return await handler(event, data)
+        except Exception:
+            failed = True
+            raise
+        finally:
+            stats.finished = True
+            current_update.reset(token)
+            key = (stats.router, stats.handler)
+            metrics = self.handlers.get(key)
+            if metrics is None:
+                metrics = self.handlers[key] = HandlerMetrics()
+            metrics.observe(time.perf_counter() - started, stats, failed)
+
+    def prometheus(self) -> str:
+        # Строки одного семейства метрик должны идти подряд
+        handlers = sorted(self.handlers.items())
+        labels = {key: f'router="{key[0]}",handler="{key[1]}"' for key, _ in handlers}
+        lines = []
+
+        def family(name: str, kind: str, value):
+            lines.append(f"# TYPE {name} {kind}")
+            for key, metrics in handlers:
+                lines.append(f"{name}{{{labels[key]}}} {value(metrics)}")
+
+        family("bot_updates_total", "counter", lambda m: m.updates)
+        family("bot_update_errors_total", "counter", lambda m: m.errors)
+        family("bot_db_statements_total", "counter", lambda m: m.statements)
+        family("bot_db_seconds_total", "counter", lambda m: f"{m.db_time:.6f}")
+
+        lines.append("# TYPE bot_update_duration_seconds histogram")
+        for key, metrics in handlers:
+            cumulative = 0
+            for bound, count in zip(LATENCY_BUCKETS + ("+Inf",), metrics.buckets):
+                cumulative += count
+                lines.append(f'bot_update_duration_seconds_bucket{{{labels[key]},le="{bound}"}} {cumulative}')
+            lines.append(f"bot_update_duration_seconds_sum{{{labels[key]}}} {metrics.latency_sum:.6f}")
+            lines.append(f"bot_update_duration_seconds_count{{{labels[key]}}} {metrics.updates}")
+
+        for name, collector in self.collectors.items():
+            for key, value in collector().items():
+                lines.append(f"# TYPE bot_{name}_{key} gauge")
+                lines.append(f"bot_{name}_{key} {float(value)}")
+        lines.append("# TYPE bot_uptime_seconds gauge")
+        lines.append(f"bot_uptime_seconds {time.time() - self.started:.0f}")
+        return "\n".join(lines) + "\n"
+
+    def summary(self, limit: int = 15) -> str:
+        # Краткая сводка для команды /stats: самые частые хендлеры
+        rows = sorted(self.handlers.items(), key=lambda item: item[1].updates, reverse=True)[:limit]
+        lines = [f"<strong>Статистика за {(time.time() - self.started) / 3600:.1f} ч</strong>"]
+        for (router, handler), metrics in rows:
+            updates = max(metrics.updates, 1)
+            lines.append(
+                f"{router}.{handler}: {metrics.updates} апд., ошибок {metrics.errors}, "
+                f"ср. {metrics.latency_sum / updates * 1000:.0f} мс, p95 ≤ {metrics.quantile(0.95) * 1000:.0f} мс, "
+                f"SQL {metrics.statements / updates:.1f} / {metrics.db_time / updates * 1000:.1f} мс"
+            )
+        for name, collector in self.collectors.items():
+            values = ", ".join(
+                f"{key}={value:.3g}" if isinstance(value, float) else f"{key}={value}"
+                for key, value in collector().items()
+            )
+            lines.append(f"{name}: {values}")
+        return "\n".join(lines)
+
+    async def serve(self, host: str, port: int) -> web.AppRunner:
+        # Экспорт для Prometheus: GET http://host:port/metrics
+        async def handle(request: web.Request) -> web.Response:
+            return web.Response(text=self.prometheus(), content_type="text/plain", charset="utf-8")
+
+        app = web.Application()
+        app.router.add_get("/metrics", handle)
+        runner = web.AppRunner(app, access_log=None)
+        await runner.setup()
+        await web.TCPSite(runner, host, port).start()
+        return runner
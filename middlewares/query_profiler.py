@@ -0,0 +1,165 @@
+import os
+import random
+import time
+from collections import Counter
+from contextvars import ContextVar
+from typing import Any, Awaitable, Callable, Dict
+
+from aiogram import BaseMiddleware
+from aiogram.types import TelegramObject
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+from middlewares.metrics import active_update
+
+
+# Запросы текущего апдейта, если он попал в выборку: [(SQL, длительность), ...]
+current_queries: ContextVar[list | None] = ContextVar("current_queries", default=None)
+
+
+def short(value, limit: int = 300) -> str:
+    text = " ".join(str(value).split())
+    return text if len(text) <= limit else text[:limit] + "..."
+
+
+def current_handler() -> str:
+    # Имя хендлера берется из замеров middlewares/metrics.py
+    stats = active_update()
+    if stats is None:
+        return "background"
+    return f"{stats.router}.{stats.handler}"
+
+
+class HandlerProfile:
+    def __init__(self):
+        self.updates = 0
+        self.statements = 0
+        self.db_time = 0.0
+        self.max_statements = 0
+        self.slow = 0
+        # SQL -> в скольких апдейтах он повторялся (возможный N+1)
+        self.repeats = Counter()
+
+
+class QueryProfiler(BaseMiddleware):
+    # Профилировщик SQL для orm_query:
+    # - медленные запросы (дольше slow_ms) печатаются с хендлером; параметры
+    #   (в них телефоны и имена пользователей) - только при log_params=True;
+    # - в апдейтах из выборки (доля sample_rate) ищутся одинаковые запросы,
+    #   выполненные repeat_threshold и более раз, - типичный признак N+1;
+    # - report() печатает сводку по хендлерам (вызывается при остановке бота).
+    # Подключается через insert_before_fsm(dp, ...) после Instrumentation.setup(dp).
+    def __init__(
+        self,
+        engine: AsyncEngine,
+        slow_ms: float = 100,
+        sample_rate: float = 1.0,
+        repeat_threshold: int = 2,
+        report_path: str | None = None,
+        log_params: bool = False,
+    ):
+        self.slow = slow_ms / 1000
+        self.log_params = log_params
+        self.sample_rate = sample_rate
+        self.repeat_threshold = repeat_threshold
+        self.report_path = report_path
+        self.handlers: dict[str, HandlerProfile] = {}
+        self.watch_engine(engine)
+
+    def _profile(self, handler: str) -> HandlerProfile:
+        profile = self.handlers.get(handler)
+        if profile is None:
+            profile = self.handlers[handler] = HandlerProfile()
+        return profile
+
+    def watch_engine(self, engine: AsyncEngine):
+        @event.listens_for(engine.sync_engine, "before_cursor_execute")
+        def before_execute(conn, cursor, statement, parameters, context, executemany):
+            conn.info.setdefault("profiler_started", []).append(time.perf_counter())
+
+        @event.listens_for(engine.sync_engine, "after_cursor_execute")
+        def after_execute(conn, cursor, statement, parameters, context, executemany):
+            duration = time.perf_counter() - conn.info["profiler_started"].pop()
+            if duration >= self.slow:
+                handler = current_handler()
+                self._profile(handler).slow += 1
+                params = f" | параметры: {short(parameters, 200)}" if self.log_params else ""
+                print(f"Медленный запрос {duration * 1000:.1f} мс в {handler}: {short(statement)}{params}")
+            queries = current_queries.get()
+            if queries is not None:
+                queries.append((statement, duration))
+
+        @event.listens_for(engine.sync_engine, "handle_error")
+        def on_error(context):
+            # Запрос упал - after_cursor_execute не будет, снимаем его отметку времени
+            conn = context.connection
+            if conn is not None and context.statement is not None and conn.info.get("profiler_started"):
+                conn.info["profiler_started"].pop()
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any],
+    ) -> Any:
+        if self.sample_rate < 1 and random.random() >= self.sample_rate:
+            return await handler(event, data)
+        queries = []
+        token = current_queries.set(queries)
+        try:
+            return await handler(event, data)
+        finally:
+            current_queries.reset(token)
+            self.finish(current_handler(), queries)
+
+    def finish(self, handler: str, queries: list):
+        profile = self._profile(handler)
+        profile.updates += 1
+        profile.statements += len(queries)
+        profile.db_time += sum(duration for _, duration in queries)
+        profile.max_statements = max(profile.max_statements, len(queries))
+
+        counts = Counter(statement for statement, _ in queries)
+        for statement, count in counts.items():
+            if count >= self.repeat_threshold:
+                profile.repeats[statement] += 1
+                print(f"Возможный N+1 в {handler}: {count} раз за апдейт: {short(statement)}")
+
+    def report(self) -> str:
+        lines = ["Профиль SQL по хендлерам (апдейты из выборки):"]
+        rows = sorted(self.handlers.items(), key=lambda item: item[1].db_time, reverse=True)
+        for handler, profile in rows:
+            updates = max(profile.updates, 1)
+            lines.append(
+                f"  {handler}: апдейтов {profile.updates}, SQL на апдейт {profile.statements / updates:.1f}"
+                f" (макс. {profile.max_statements}), БД {profile.db_time / updates * 1000:.1f} мс/апдейт,"
+                f" медленных {profile.slow}"
+            )
+            for statement, updates_with_repeat in profile.repeats.most_common(3):
+                lines.append(f"    повторы в {updates_with_repeat} апд.: {short(statement, 150)}")
+        report = "\n".join(lines)
+        print(report)
+        if self.report_path:
+            with open(self.report_path, "w", encoding="utf-8") as file:
+                file.write(report + "\n")
+        return report
+
+
+def create_query_profiler(engine: AsyncEngine) -> QueryProfiler | None:
+    # QUERY_PROFILE=off (по умолчанию) | debug | sample
+    # debug - каждый апдейт, порог медленного запроса 20 мс
+    # sample - доля QUERY_SAMPLE_RATE апдейтов (0.01), порог 200 мс
+    # QUERY_SLOW_MS, QUERY_REPEAT_THRESHOLD, QUERY_PROFILE_REPORT (файл для сводки)
+    # QUERY_LOG_PARAMS=1 - печатать параметры медленных запросов (по умолчанию скрыты)
+    mode = os.getenv("QUERY_PROFILE", "off")
+    if mode not in ("debug", "sample"):
+        return None
+    debug = mode == "debug"
+    return QueryProfiler(
+        engine,
+        slow_ms=float(os.getenv("QUERY_SLOW_MS", 20 if debug else 200)),
+        sample_rate=1.0 if debug else float(os.getenv("QUERY_SAMPLE_RATE", 0.01)),
+        repeat_threshold=int(os.getenv("QUERY_REPEAT_THRESHOLD", 2)),
+        report_path=os.getenv("QUERY_PROFILE_REPORT"),
+        log_params=os.getenv("QUERY_LOG_PARAMS") == "1",
+    )
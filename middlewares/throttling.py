@@ -0,0 +1,187 @@
+import asyncio
+import heapq
+import itertools
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from aiogram import Bot
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware, NextRequestMiddlewareType
+from aiogram.exceptions import TelegramRetryAfter
+from aiogram.methods import TelegramMethod
+
+from common.tasks import create_background_task
+
+
+# Полосы приоритета исходящих запросов: ответы пользователю идут раньше массовых рассылок
+INTERACTIVE = 0
+BULK = 1
+
+send_priority: ContextVar[int] = ContextVar("send_priority", default=INTERACTIVE)
+
+
+@contextmanager
+def bulk_sending():
+    # Все запросы к API внутри блока уходят в полосу BULK
+    token = send_priority.set(BULK)
+    try:
+        yield
+    finally:
+        send_priority.reset(token)
+
+
+class TokenBucket:
+    # Ведро токенов с резервированием: take() сразу занимает токен
+    # и возвращает, сколько секунд нужно подождать до его появления.
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def delay(self) -> float:
+        self._refill()
+        if self.tokens >= 1:
+            return 0
+        return (1 - self.tokens) / self.rate
+
+    def take(self) -> float:
+        self._refill()
+        self.tokens -= 1
+        if self.tokens >= 0:
+            return 0
+        return -self.tokens / self.rate
+
+    def pause(self, seconds: float):
+        # После RetryAfter ведро пустеет на указанное время
+        self._refill()
+        self.tokens = min(self.tokens, 0) - seconds * self.rate
+
+
+class SendRateLimiter(BaseRequestMiddleware):
+    # Центральный планировщик исходящих запросов к Telegram Bot API.
+    # Ограничивает общий поток (global_rate в секунду) и поток в каждый чат
+    # (chat_rate в секунду), при TelegramRetryAfter ждет и повторяет запрос.
+    # Лимиты Telegram: ~30 сообщений/с на бота и ~1 сообщение/с в один чат.
+    # Лимит чата касается новых сообщений: правки (листание меню - это edit_media)
+    # идут только через общий поток, иначе быстрое листание ждало бы по секунде.
+    # Лимиты действуют в пределах процесса: при нескольких webhook-воркерах
+    # global_rate каждого нужно делить на их число (так делает app.py).
+    LIMITED_PREFIXES = ("send", "edit", "copy", "forward")
+    CHAT_LIMITED_PREFIXES = ("send", "copy", "forward")
+
+    def __init__(
+        self,
+        global_rate: float = 25,
+        chat_rate: float = 1,
+        chat_burst: float = 3,
+        max_retries: int = 3,
+        max_chats: int = 10000,
+    ):
+        self.global_bucket = TokenBucket(global_rate, global_rate)
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.chat_buckets: dict[int | str, TokenBucket] = {}
+        self.max_chats = max_chats
+        self.max_retries = max_retries
+        # Очередь ожидающих глобальный токен: (приоритет, номер, future)
+        self.waiters: list = []
+        self.counter = itertools.count()
+        self.dispatcher: asyncio.Task | None = None
+        # Метрики
+        self.sent = {INTERACTIVE: 0, BULK: 0}
+        self.wait_time = {INTERACTIVE: 0.0, BULK: 0.0}
+        self.max_wait = {INTERACTIVE: 0.0, BULK: 0.0}
+        self.retries = 0
+
+    def _chat_bucket(self, chat_id) -> TokenBucket:
+        bucket = self.chat_buckets.get(chat_id)
+        if bucket is None:
+            if len(self.chat_buckets) >= self.max_chats:
+                # Самые старые ведра давно полные - их можно выбросить
+                del self.chat_buckets[next(iter(self.chat_buckets))]
+            bucket = self.chat_buckets[chat_id] = TokenBucket(self.chat_rate, self.chat_burst)
+        return bucket
+
+    async def _dispatch(self):
+        # Раздает глобальные токены ожидающим в порядке приоритета
+        while self.waiters:
+            delay = self.global_bucket.delay()
+            if delay:
+                await asyncio.sleep(delay)
+                continue
+            _, _, future = heapq.heappop(self.waiters)
+            if not future.done():
+                self.global_bucket.take()
+                future.set_result(None)
+
+    async def _acquire_global(self, priority: int):
+        if not self.waiters and not self.global_bucket.delay():
+            self.global_bucket.take()
+            return
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self.waiters, (priority, next(self.counter), future))
+        if self.dispatcher is None or self.dispatcher.done():
+            self.dispatcher = create_background_task(self._dispatch())
+        await future
+
+    async def __call__(
+        self,
+        make_request: NextRequestMiddlewareType,
+        bot: Bot,
+        method: TelegramMethod,
+    ):
+        if not method.__api_method__.startswith(self.LIMITED_PREFIXES):
+            return await make_request(bot, method)
+
+        priority = send_priority.get()
+        chat_id = getattr(method, "chat_id", None)
+        chat_limited = chat_id is not None and method.__api_method__.startswith(self.CHAT_LIMITED_PREFIXES)
+        started = time.monotonic()
+
+        for attempt in range(self.max_retries + 1):
+            if chat_limited:
+                delay = self._chat_bucket(chat_id).take()
+                if delay:
+                    await asyncio.sleep(delay)
+            await self._acquire_global(priority)
+
+            if attempt == 0:
+                waited = time.monotonic() - started
+                self.sent[priority] += 1
+                self.wait_time[priority] += waited
+                self.max_wait[priority] = max(self.max_wait[priority], waited)
+
+            try:
+                return await make_request(bot, method)
+            except TelegramRetryAfter as e:
+                if attempt == self.max_retries:
+                    raise
+                self.retries += 1
+                if chat_id is not None:
+                    self._chat_bucket(chat_id).pause(e.retry_after)
+                else:
+                    self.global_bucket.pause(e.retry_after)
+                await asyncio.sleep(e.retry_after)
+
+    def stats(self) -> dict:
+        depth = {INTERACTIVE: 0, BULK: 0}
+        for priority, _, future in self.waiters:
+            if not future.done():
+                depth[priority] += 1
+        return {
+            "queue_interactive": depth[INTERACTIVE],
+            "queue_bulk": depth[BULK],
+            "sent_interactive": self.sent[INTERACTIVE],
+            "sent_bulk": self.sent[BULK],
+            "avg_wait_interactive": self.wait_time[INTERACTIVE] / max(self.sent[INTERACTIVE], 1),
+            "avg_wait_bulk": self.wait_time[BULK] / max(self.sent[BULK], 1),
+            "max_wait_interactive": self.max_wait[INTERACTIVE],
+            "max_wait_bulk": self.max_wait[BULK],
+            "retry_after": self.retries,
+        }
@@ -0,0 +1,134 @@
+import asyncio
+import json
+import multiprocessing
+import os
+
+from aiohttp import ClientSession, web
+from aiogram import Bot, Dispatcher
+from aiogram.webhook.aiohttp_server import SimpleRequestHandler, setup_application
+
+
+# Настройки webhook-режима (BOT_MODE=webhook):
+# WEBHOOK_URL=https://example.com - публичный адрес, который увидит Telegram
+# WEBHOOK_PATH=/webhook
+# WEBHOOK_HOST=0.0.0.0, WEBHOOK_PORT=8080 - где слушать
+# WEBHOOK_WORKERS=4 - число процессов с диспетчером
+# WEBHOOK_SECRET - секрет для заголовка X-Telegram-Bot-Api-Secret-Token
+WEBHOOK_URL = os.getenv("WEBHOOK_URL", "")
+WEBHOOK_PATH = os.getenv("WEBHOOK_PATH", "/webhook")
+WEBHOOK_HOST = os.getenv("WEBHOOK_HOST", "0.0.0.0")
+WEBHOOK_PORT = int(os.getenv("WEBHOOK_PORT", 8080))
+WEBHOOK_WORKERS = int(os.getenv("WEBHOOK_WORKERS", 1))
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET")
+
+SECRET_HEADER = "X-Telegram-Bot-Api-Secret-Token"
+
+# Поля апдейта, в которых лежит чат или пользователь
+CHAT_FIELDS = (
+    "message", "edited_message", "channel_post", "edited_channel_post",
+    "my_chat_member", "chat_member", "chat_join_request",
+)
+USER_FIELDS = ("callback_query", "inline_query", "chosen_inline_result", "pre_checkout_query", "shipping_query")
+
+
+def get_route_id(update: dict) -> int:
+    # Апдейты одного чата всегда попадают в один воркер - порядок внутри чата сохраняется
+    for field in CHAT_FIELDS:
+        if field in update:
+            return update[field]["chat"]["id"]
+    for field in USER_FIELDS:
+        if field in update:
+            message = update[field].get("message")
+            if message:
+                return message["chat"]["id"]
+            return update[field]["from"]["id"]
+    return update.get("update_id", 0)
+
+
+def worker_port(index: int) -> int:
+    return WEBHOOK_PORT + 1 + index
+
+
+async def set_webhook(bot: Bot, dp: Dispatcher):
+    await bot.set_webhook(
+        f"{WEBHOOK_URL}{WEBHOOK_PATH}",
+        secret_token=WEBHOOK_SECRET,
+        allowed_updates=dp.resolve_used_update_types(),
+    )
+
+
+def build_worker_app(dp: Dispatcher, bot: Bot, secret_token: str | None, **kwargs) -> web.Application:
+    # Обычное aiogram-приложение: те же роутеры и middleware, что и при polling
+    app = web.Application()
+    SimpleRequestHandler(dispatcher=dp, bot=bot, secret_token=secret_token).register(app, path=WEBHOOK_PATH)
+    setup_application(app, dp, bot=bot, **kwargs)
+    return app
+
+
+def run_worker(dp: Dispatcher, bot: Bot, index: int):
+    # Воркер слушает только localhost, секрет уже проверил фронт.
+    # Схему БД создает главный процесс, поэтому create_schema=False.
+    # Фоновые задачи (например, рассылки) продолжает только первый воркер.
+    app = build_worker_app(dp, bot, secret_token=None, create_schema=False, primary=index == 0, worker=index)
+    web.run_app(app, host="127.0.0.1", port=worker_port(index), print=None)
+
+
+def build_front_app(bot: Bot, dp: Dispatcher, workers: int) -> web.Application:
+    app = web.Application()
+
+    async def on_startup(app: web.Application):
+        app["client"] = ClientSession()
+        await set_webhook(bot, dp)
+
+    async def on_cleanup(app: web.Application):
+        await app["client"].close()
+        await bot.session.close()
+
+    async def handle(request: web.Request) -> web.Response:
+        if WEBHOOK_SECRET and request.headers.get(SECRET_HEADER) != WEBHOOK_SECRET:
+            return web.Response(status=401)
+        body = await request.read()
+        index = get_route_id(json.loads(body)) % workers
+        async with request.app["client"].post(
+            f"http://127.0.0.1:{worker_port(index)}{WEBHOOK_PATH}",
+            data=body,
+            headers={"Content-Type": "application/json"},
+        ) as response:
+            return web.Response(status=response.status, body=await response.read())
+
+    app.router.add_post(WEBHOOK_PATH, handle)
+    app.on_startup.append(on_startup)
+    app.on_cleanup.append(on_cleanup)
+    return app
+
+
+def run_webhook(dp: Dispatcher, bot: Bot, prepare):
+    # prepare - корутина, которая создает/мигрирует БД (один раз на все процессы)
+    if WEBHOOK_WORKERS <= 1:
+        app = build_worker_app(dp, bot, secret_token=WEBHOOK_SECRET)
+
+        async def on_startup(app: web.Application):
+            await set_webhook(bot, dp)
+
+        app.on_startup.append(on_startup)
+        web.run_app(app, host=WEBHOOK_HOST, port=WEBHOOK_PORT)
+        return
+
+    asyncio.run(prepare())
+
+    # fork: дочерние процессы наследуют готовые dp и bot без повторного импорта app.py.
+    # К этому моменту у процесса нет открытых соединений с БД и Telegram.
+    context = multiprocessing.get_context("fork")
+    workers = [
+        context.Process(target=run_worker, args=(dp, bot, index), daemon=True)
+        for index in range(WEBHOOK_WORKERS)
+    ]
+    for process in workers:
+        process.start()
+    print(f"Запущено воркеров: {WEBHOOK_WORKERS}")
+
+    try:
+        web.run_app(build_front_app(bot, dp, WEBHOOK_WORKERS), host=WEBHOOK_HOST, port=WEBHOOK_PORT)
+    finally:
+        for process in workers:
+            process.terminate()